@@ -0,0 +1,297 @@
+"""
+Pre-aggregated request reports.
+
+Reports (request volume per team, category or month, MTTR, hours booked per
+technician) read only the rollups: per-day totals for each value of each
+report dimension (request_rollups), and the same summed per month
+(request_monthly_rollups) so a report over years reads whole months from
+the monthly table and only its partial first and last months from the
+daily one. A request counts towards up to three days: the day it was
+opened, the day it was completed (with how long that took) and the day it
+is scheduled for (with its duration).
+
+refresh_rollups() brings the rollups up to date incrementally. It reads
+the requests whose updated_at is past the stored watermark and recounts
+the days they count towards now, plus the days they counted towards at the
+previous run (kept in rollup_request_days). Deleted requests are flagged
+there by an ORM event and their days recounted the same way. Each dirty
+day is recomputed from the request table's date indexes rather than
+patched with deltas, so processing a request twice is harmless and the
+watermark is read with an overlap that catches transactions committing
+out of order.
+"""
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, update, func, case, or_, and_, event
+from models import (db, MaintenanceRequest, RequestRollup, MonthlyRequestRollup, RollupRequestDays, RollupState,
+                    MaintenanceTeam, Equipment, WorkCenter, Technician)
+
+ROLLUP_BATCH_SIZE = 5000
+# updated_at is stamped when a row is written, not when its transaction commits
+WATERMARK_OVERLAP = timedelta(seconds=int(os.getenv('ROLLUP_WATERMARK_OVERLAP', '300')))
+STATE_NAME = 'requests'
+# Dirty days closer than this are recounted with one range scan (clean days in between are skipped)
+SPAN_GAP = timedelta(days=2)
+MAX_SPAN = timedelta(days=92)
+
+# report dimension -> request column holding its value
+DIMENSIONS = {
+    'stage': MaintenanceRequest.stage,
+    'team': MaintenanceRequest.maintenance_team_id,
+    'category': MaintenanceRequest.category,
+    'equipment': MaintenanceRequest.equipment_id,
+    'workcenter': MaintenanceRequest.workcenter_id,
+    'technician': MaintenanceRequest.assigned_technician_id,
+}
+# Dimensions whose values are ids, labelled with the name of the referenced row
+DIMENSION_MODELS = {'team': MaintenanceTeam, 'equipment': Equipment, 'workcenter': WorkCenter,
+                    'technician': Technician}
+MEASURES = ('opened_count', 'completed_count', 'repaired_count', 'repair_hours',
+            'scheduled_count', 'scheduled_hours')
+REPORT_INTERVALS = ('day', 'month', 'total')
+
+
+@dataclass
+class RefreshResult:
+    requests: int = 0
+    days: int = 0
+
+
+def _day(value):
+    return value.date() if value else None
+
+
+def _spans(days):
+    """Group sorted days into (start, end) datetime ranges, end exclusive"""
+    spans = []
+    for day in days:
+        start = datetime.combine(day, datetime.min.time())
+        if spans and start - spans[-1][1] < SPAN_GAP and start - spans[-1][0] < MAX_SPAN:
+            spans[-1][1] = start + timedelta(days=1)
+        else:
+            spans.append([start, start + timedelta(days=1)])
+    return spans
+
+
+def _hours_between(dialect, start, end):
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 24
+    return func.extract('epoch', end - start) / 3600
+
+
+def _day_measures(dialect):
+    """(date column, {measure: aggregate}) for each way a request counts towards a day"""
+    request = MaintenanceRequest
+    repaired = request.stage == 'Repaired'
+    return [
+        (request.created_at, {'opened_count': func.count()}),
+        (request.completed_at, {
+            'completed_count': func.count(),
+            'repaired_count': func.sum(case((repaired, 1), else_=0)),
+            'repair_hours': func.sum(case((repaired, _hours_between(dialect, request.created_at,
+                                                                    request.completed_at)), else_=0)),
+        }),
+        (request.scheduled_date, {
+            'scheduled_count': func.count(),
+            'scheduled_hours': func.sum(func.coalesce(request.duration_hours, 0)),
+        }),
+    ]
+
+
+def recount_days(days):
+    """Replace the rollups of `days` with totals recomputed from the requests"""
+    days = set(days)
+    groupings = [('all', None)] + list(DIMENSIONS.items())
+    totals = {}
+    for start, end in _spans(sorted(days)):
+        for date_column, measures in _day_measures(db.engine.dialect.name):
+            day = func.date(date_column, type_=db.Date)
+            for dimension, column in groupings:
+                keys = [day] if column is None else [day, column]
+                rows = db.session.execute(
+                    select(*keys, *(aggregate.label(name) for name, aggregate in measures.items()))
+                    .where(date_column >= start, date_column < end)
+                    .group_by(*keys))
+                for row in rows:
+                    if row[0] not in days:
+                        continue
+                    value = None if column is None or row[1] is None else str(row[1])
+                    entry = totals.setdefault((row[0], dimension, value), dict.fromkeys(MEASURES, 0))
+                    for name in measures:
+                        entry[name] += row._mapping[name] or 0
+
+    sorted_days = sorted(days)
+    for index in range(0, len(sorted_days), 500):
+        db.session.execute(delete(RequestRollup).where(RequestRollup.day.in_(sorted_days[index:index + 500])))
+    rows = [dict(entry, day=day, month=day.replace(day=1), dimension=dimension, dimension_value=value)
+            for (day, dimension, value), entry in totals.items()]
+    for index in range(0, len(rows), ROLLUP_BATCH_SIZE):
+        db.session.execute(RequestRollup.__table__.insert(), rows[index:index + ROLLUP_BATCH_SIZE])
+
+    # Re-sum the months those days fall in
+    months = sorted({day.replace(day=1) for day in days})
+    daily, monthly = RequestRollup, MonthlyRequestRollup
+    for index in range(0, len(months), 500):
+        chunk = months[index:index + 500]
+        db.session.execute(delete(monthly).where(monthly.month.in_(chunk)))
+        db.session.execute(monthly.__table__.insert().from_select(
+            ['month', 'dimension', 'dimension_value', *MEASURES],
+            select(daily.month, daily.dimension, daily.dimension_value,
+                   *(func.sum(getattr(daily, measure)) for measure in MEASURES))
+            .where(daily.month.in_(chunk))
+            .group_by(daily.month, daily.dimension, daily.dimension_value)))
+
+
+def refresh_rollups(now=None, batch_size=ROLLUP_BATCH_SIZE):
+    """Recount the days touched by requests changed or deleted since the last run. Returns a RefreshResult."""
+    now = now or datetime.utcnow()
+    state = db.session.get(RollupState, STATE_NAME) or RollupState(name=STATE_NAME)
+    result = RefreshResult()
+    dirty = set()
+    request = MaintenanceRequest
+    watermark = state.watermark
+    last = None
+    day_columns = (RollupRequestDays.opened_day, RollupRequestDays.completed_day, RollupRequestDays.scheduled_day)
+
+    # Changed requests in (updated_at, id) order, a batch at a time
+    while True:
+        query = (select(request.id, request.created_at, request.completed_at, request.scheduled_date,
+                        request.updated_at)
+                 .order_by(request.updated_at, request.id).limit(batch_size))
+        if last:
+            query = query.where(or_(request.updated_at > last[0],
+                                    and_(request.updated_at == last[0], request.id > last[1])))
+        elif state.watermark:
+            query = query.where(request.updated_at > state.watermark - WATERMARK_OVERLAP)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        previous = db.session.execute(select(*day_columns).where(RollupRequestDays.request_id.in_(ids)))
+        dirty.update(day for days in previous for day in days)
+        db.session.execute(delete(RollupRequestDays).where(RollupRequestDays.request_id.in_(ids)))
+        counted = [{'request_id': row.id, 'opened_day': _day(row.created_at),
+                    'completed_day': _day(row.completed_at), 'scheduled_day': _day(row.scheduled_date)}
+                   for row in rows]
+        db.session.execute(RollupRequestDays.__table__.insert(), counted)
+        dirty.update(days[key] for days in counted for key in ('opened_day', 'completed_day', 'scheduled_day'))
+        result.requests += len(rows)
+        last = (rows[-1].updated_at, rows[-1].id)
+        if last[0] and (watermark is None or last[0] > watermark):
+            watermark = last[0]
+        if len(rows) < batch_size:
+            break
+
+    # Deleted requests
+    removed = RollupRequestDays.removed
+    dirty.update(day for days in db.session.execute(select(*day_columns).where(removed)) for day in days)
+    db.session.execute(delete(RollupRequestDays).where(removed))
+
+    dirty.discard(None)
+    recount_days(dirty)
+    result.days = len(dirty)
+
+    state.watermark = watermark
+    state.refreshed_at = now
+    db.session.add(state)
+    db.session.commit()
+    return result
+
+
+def rebuild_rollups():
+    """Drop all rollups and recount every request from scratch"""
+    db.session.execute(delete(RequestRollup))
+    db.session.execute(delete(MonthlyRequestRollup))
+    db.session.execute(delete(RollupRequestDays))
+    db.session.execute(delete(RollupState))
+    return refresh_rollups()
+
+
+@event.listens_for(MaintenanceRequest, 'after_delete')
+def _flag_removed_request(mapper, connection, target):
+    connection.execute(update(RollupRequestDays)
+                       .where(RollupRequestDays.request_id == target.id)
+                       .values(removed=True))
+
+
+def rollup_state():
+    """The RollupState of the request rollups, None if they were never refreshed"""
+    return db.session.get(RollupState, STATE_NAME)
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _sum_rollups(totals, model, period, dimension, conditions):
+    """Add the rollup rows of `model` matching `conditions` into totals[(period, value)]"""
+    groups = [column for column in (period, model.dimension_value if dimension else None) if column is not None]
+    rows = db.session.execute(
+        select(*groups, *(func.sum(getattr(model, measure)).label(measure) for measure in MEASURES))
+        .where(model.dimension == (dimension or 'all'), *conditions)
+        .group_by(*groups))
+    for row in rows:
+        key = (row[0] if period is not None else None, row.dimension_value if dimension else None)
+        entry = totals.setdefault(key, dict.fromkeys(MEASURES, 0))
+        for measure in MEASURES:
+            entry[measure] += row._mapping[measure] or 0
+
+
+def rollup_report(dimension, start, end, interval='month', limit=None):
+    """
+    Request totals from start to end (dates, inclusive) per period and, when
+    `dimension` is one of DIMENSIONS, per value of it, busiest first within
+    each period (and only the first `limit` rows). Returns dicts with period,
+    key, label, opened, completed, repaired, mttr_hours (mean hours from
+    opening to repair), scheduled and scheduled_hours.
+    """
+    daily, monthly = RequestRollup, MonthlyRequestRollup
+    totals = {}
+    if interval == 'day':
+        _sum_rollups(totals, daily, daily.day, dimension, [daily.day >= start, daily.day <= end])
+    else:
+        # Whole months from the monthly rollups, the partial months at either end from the daily ones
+        first_full = start if start.day == 1 else _next_month(start)
+        after_full = _next_month(end) if _next_month(end) - timedelta(days=1) == end else end.replace(day=1)
+        by_month = interval == 'month'
+        if first_full < after_full:
+            _sum_rollups(totals, monthly, monthly.month if by_month else None, dimension,
+                         [monthly.month >= first_full, monthly.month < after_full])
+            edges = [(start, first_full), (after_full, end + timedelta(days=1))]
+        else:
+            edges = [(start, end + timedelta(days=1))]
+        for edge_start, edge_end in edges:
+            if edge_start < edge_end:
+                _sum_rollups(totals, daily, daily.month if by_month else None, dimension,
+                             [daily.day >= edge_start, daily.day < edge_end])
+
+    ordered = sorted(totals.items(), key=lambda item: (item[0][0] or date.min, -item[1]['opened_count']))
+    if limit:
+        ordered = ordered[:limit]
+
+    labels = {}
+    if dimension in DIMENSION_MODELS:
+        ids = {int(value) for (_, value), _ in ordered if value is not None}
+        if ids:
+            model = DIMENSION_MODELS[dimension]
+            labels = {str(id): name for id, name in
+                      db.session.execute(select(model.id, model.name).where(model.id.in_(ids)))}
+
+    report = []
+    for (period, value), entry in ordered:
+        key = label = value
+        if dimension in DIMENSION_MODELS and value is not None:
+            key, label = int(value), labels.get(value, value)
+        report.append({
+            'period': period.strftime('%Y-%m' if interval == 'month' else '%Y-%m-%d') if period else 'total',
+            'key': key,
+            'label': label,
+            'opened': entry['opened_count'],
+            'completed': entry['completed_count'],
+            'repaired': entry['repaired_count'],
+            'mttr_hours': round(entry['repair_hours'] / entry['repaired_count'], 1) if entry['repaired_count'] else None,
+            'scheduled': entry['scheduled_count'],
+            'scheduled_hours': round(entry['scheduled_hours'], 1),
+        })
+    return report
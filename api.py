@@ -0,0 +1,316 @@
+"""
+Versioned JSON API (/api/v1) for requests, equipment, work centers, teams and technicians,
+plus reports served from the daily rollups (/api/v1/reports), delta sync of requests for
+offline devices (/api/v1/sync/requests, see sync.py) and the change history of requests and
+equipment (/api/v1/<requests|equipment>/<id>/history, see audit.py).
+
+Collections support field selection (?fields=id,subject), filtering,
+keyset pagination (?limit=&cursor=) and conditional GET. Every response
+carries a strong ETag and Last-Modified derived from the rows' updated_at
+column. A client that sends the ETag back in If-None-Match gets a 304
+after a single aggregate query, without any rows being loaded or
+serialized.
+"""
+import hashlib
+from datetime import date, datetime, timedelta
+from functools import wraps
+from flask import Blueprint, jsonify, request, abort, make_response
+from sqlalchemy import select, func
+from auth import load_current_user
+from models import db, Equipment, WorkCenter, MaintenanceRequest, MaintenanceTeam, Technician
+from pagination import paginate_keyset
+from analytics import rollup_report, rollup_state, DIMENSIONS, REPORT_INTERVALS
+from sync import changes_since, apply_mutations, current_cursor, sync_supported, MAX_MUTATIONS
+from audit import timeline
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+DEFAULT_REPORT_DAYS = 365
+DEFAULT_SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+
+# resource name -> model, exposed fields and query-string filters (name -> (column, type))
+RESOURCES = {
+    'requests': {
+        'model': MaintenanceRequest,
+        'fields': ['id', 'subject', 'request_type', 'stage', 'category', 'equipment_id', 'workcenter_id',
+                   'maintenance_team_id', 'assigned_technician_id', 'assigned_technician', 'scheduled_date',
+                   'duration_hours', 'recurrence_rule_id', 'created_at', 'updated_at'],
+        'filters': {
+            'stage': (MaintenanceRequest.stage, str),
+            'category': (MaintenanceRequest.category, str),
+            'team': (MaintenanceRequest.maintenance_team_id, int),
+            'equipment': (MaintenanceRequest.equipment_id, int),
+            'workcenter': (MaintenanceRequest.workcenter_id, int),
+            'technician': (MaintenanceRequest.assigned_technician_id, int),
+        },
+    },
+    'equipment': {
+        'model': Equipment,
+        'fields': ['id', 'name', 'serial_number', 'category', 'department', 'assigned_employee',
+                   'maintenance_team_id', 'default_technician_id', 'default_technician', 'purchase_date',
+                   'warranty_end', 'location', 'status', 'notes', 'open_request_count', 'new_request_count',
+                   'in_progress_request_count', 'last_maintenance_date', 'operating_hours', 'updated_at'],
+        'filters': {
+            'category': (Equipment.category, str),
+            'department': (Equipment.department, str),
+            'status': (Equipment.status, str),
+            'team': (Equipment.maintenance_team_id, int),
+        },
+    },
+    'workcenters': {
+        'model': WorkCenter,
+        'fields': ['id', 'name', 'code', 'location', 'department', 'responsible_person', 'description',
+                   'status', 'created_at', 'updated_at'],
+        'filters': {
+            'department': (WorkCenter.department, str),
+            'status': (WorkCenter.status, str),
+        },
+    },
+    'teams': {
+        'model': MaintenanceTeam,
+        'fields': ['id', 'name', 'members', 'updated_at'],
+        'filters': {},
+    },
+    'technicians': {
+        'model': Technician,
+        'fields': ['id', 'name', 'active', 'updated_at'],
+        'filters': {},
+    },
+}
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if load_current_user() is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_error(status, message):
+    abort(make_response(jsonify({'error': message}), status))
+
+
+def _resource(name):
+    if name not in RESOURCES:
+        api_error(404, f'Unknown resource: {name}')
+    return RESOURCES[name]
+
+
+def _selected_fields(resource):
+    requested = request.args.get('fields')
+    if not requested:
+        return resource['fields']
+    fields = [field.strip() for field in requested.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in resource['fields']]
+    if unknown:
+        api_error(400, f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def _filter_conditions(resource):
+    conditions = []
+    for name, (column, kind) in resource['filters'].items():
+        value = request.args.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            conditions.append(column == kind(value))
+        except ValueError:
+            api_error(400, f'{name} must be an integer')
+    return conditions
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def serialize(obj, fields):
+    return {field: _json_value(getattr(obj, field)) for field in fields}
+
+
+def _etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def conditional_json(payload, etag, last_modified):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+@api.route('/<name>')
+@api_login_required
+def list_resource(name):
+    resource = _resource(name)
+    model = resource['model']
+    fields = _selected_fields(resource)
+    conditions = _filter_conditions(resource)
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+    # Validator from one aggregate: any insert/update bumps max(updated_at), a delete changes the count
+    total, last_modified = db.session.execute(
+        select(func.count(model.id), func.max(model.updated_at)).where(*conditions)).one()
+    etag = _etag(name, total, last_modified, sorted(request.args.items(multi=True)))
+    if request.if_none_match.contains(etag):
+        return not_modified(etag, last_modified)
+
+    page = paginate_keyset(model.query.filter(*conditions), [model.id],
+                           request.args.get('cursor'), limit)
+    return conditional_json({
+        'data': [serialize(obj, fields) for obj in page],
+        'next_cursor': page.next_cursor,
+        'total': total,
+    }, etag, last_modified)
+
+
+@api.route('/<name>/<int:id>')
+@api_login_required
+def get_resource(name, id):
+    resource = _resource(name)
+    model = resource['model']
+    fields = _selected_fields(resource)
+
+    updated_at = db.session.scalar(select(model.updated_at).where(model.id == id))
+    if updated_at is None and db.session.get(model, id) is None:
+        api_error(404, f'{name} {id} not found')
+    etag = _etag(name, id, updated_at, fields)
+    if request.if_none_match.contains(etag) or (
+            not request.if_none_match and updated_at and request.if_modified_since
+            and updated_at.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)):
+        return not_modified(etag, updated_at)
+
+    obj = db.session.get(model, id)
+    return conditional_json({'data': serialize(obj, fields)}, etag, updated_at)
+
+
+# resource name -> audit entity_type
+HISTORY_RESOURCES = {'requests': 'request', 'equipment': 'equipment'}
+
+
+@api.route('/<name>/<int:id>/history')
+@api_login_required
+def resource_history(name, id):
+    """Audit events of one request or piece of equipment, newest first, paged with ?limit=&cursor="""
+    if name not in HISTORY_RESOURCES:
+        api_error(404, f'No history for {name}')
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    before_id = request.args.get('cursor', type=int)
+
+    # Kept after a delete, so no existence check: a deleted row's history ends with its delete event
+    events, next_cursor = timeline(HISTORY_RESOURCES[name], id, before_id, limit)
+    return jsonify({
+        'data': [serialize(event, ['id', 'action', 'changes', 'user_id', 'username', 'created_at'])
+                 for event in events],
+        'next_cursor': next_cursor,
+    })
+
+
+def _date_arg(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        api_error(400, f'{name} must be a YYYY-MM-DD date')
+
+
+@api.route('/reports')
+@api.route('/reports/<dimension>')
+@api_login_required
+def report(dimension=None):
+    """Rollup totals per ?interval= (day, month or total) between ?start= and ?end=, optionally per dimension"""
+    if dimension is not None and dimension not in DIMENSIONS:
+        api_error(404, f'Unknown report dimension: {dimension}')
+    interval = request.args.get('interval', 'month')
+    if interval not in REPORT_INTERVALS:
+        api_error(400, f'interval must be one of {", ".join(REPORT_INTERVALS)}')
+    end = _date_arg('end', date.today())
+    start = _date_arg('start', end - timedelta(days=DEFAULT_REPORT_DAYS))
+
+    # Rollups only change when the refresh job runs, so its timestamp validates every report
+    state = rollup_state()
+    refreshed_at = state.refreshed_at if state else None
+    etag = _etag('reports', dimension, interval, start, end, refreshed_at)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag, refreshed_at)
+    return conditional_json({
+        'data': rollup_report(dimension, start, end, interval),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'refreshed_at': _json_value(refreshed_at),
+    }, etag, refreshed_at)
+
+
+# Everything a device needs to show and edit a request offline
+SYNC_FIELDS = RESOURCES['requests']['fields'] + ['completed_at', 'change_seq', 'row_version']
+
+
+def _require_sync():
+    if not sync_supported():
+        api_error(501, 'Sync requires the SQLite change triggers')
+
+
+@api.route('/sync/requests')
+@api_login_required
+def sync_changes():
+    """Requests changed and ids deleted after ?cursor= (0 for a full download), oldest change first"""
+    _require_sync()
+    cursor = request.args.get('cursor', 0, type=int)
+    if cursor < 0:
+        api_error(400, 'cursor must be a non-negative integer')
+    if cursor > current_cursor():
+        # The server was restored to an earlier state than the device has seen
+        api_error(409, 'cursor is ahead of the server; sync again from cursor 0')
+    limit = min(max(request.args.get('limit', DEFAULT_SYNC_PAGE_SIZE, type=int), 1), MAX_SYNC_PAGE_SIZE)
+
+    page = changes_since(cursor, limit)
+    return jsonify({
+        'data': [serialize(obj, SYNC_FIELDS) for obj in page.requests],
+        'deleted': page.deleted,
+        'cursor': page.cursor,
+        'has_more': page.has_more,
+    })
+
+
+@api.route('/sync/requests', methods=['POST'])
+@api_login_required
+def sync_mutations():
+    """
+    Apply queued offline edits: {"mutations": [{"id", "row_version", "changes": {...}}]}.
+    Each result carries the request as it now is, so a conflict can be resolved on the device.
+    """
+    _require_sync()
+    payload = request.get_json(silent=True)
+    mutations = payload.get('mutations') if isinstance(payload, dict) else None
+    if not isinstance(mutations, list) or not all(isinstance(mutation, dict) for mutation in mutations):
+        api_error(400, 'Expected {"mutations": [{"id", "row_version", "changes"}, ...]}')
+    if len(mutations) > MAX_MUTATIONS:
+        api_error(400, f'At most {MAX_MUTATIONS} mutations per batch')
+
+    results = []
+    for result in apply_mutations(mutations):
+        entry = {'id': result.id, 'status': result.status}
+        if result.error:
+            entry['error'] = result.error
+        if result.request is not None:
+            entry['data'] = serialize(result.request, SYNC_FIELDS)
+        results.append(entry)
+    return jsonify({'results': results})
@@ -1,10 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from models import db, User, Equipment, MaintenanceTeam, MaintenanceRequest, WorkCenter
-from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, abort
+from models import db, User, Equipment, MaintenanceTeam, MaintenanceRequest, WorkCenter, RecurrenceRule, Technician, REQUEST_STAGES, RECURRENCE_UNITS, CLOSED_STAGES
+from sqlalchemy import select, update, literal, union_all
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, date, timedelta
+import calendar
+import math
 import os
 import re
 from datetime import datetime as dt
-from firebase_auth_service import FirebaseAuthService
+from firebase_auth_service import auth_provider
+from migrations import run_migrations
+from database import configure_database, configure_engine
+from pagination import paginate_keyset
+from auth import login_required, load_current_user
+from counters import refresh_equipment_counters
+from importer import import_stream, detect_format, IMPORT_KINDS
+from instrumentation import init_instrumentation
+from events import broker, event_stream, STREAM_RETRY_SECONDS
+from scheduler import generate_preventive_requests, DEFAULT_HORIZON_DAYS
+from assignment import auto_assign, rebalance, overlapping_bookings, OPEN_STAGES
+from technicians import find_or_create_technician, set_team_members
+from search import search, install_search_index, SEARCH_KINDS, SUGGEST_CANDIDATES
+from lookup import lookup, LOOKUPS, DEFAULT_LOOKUP_LIMIT
+from analytics import refresh_rollups, rebuild_rollups, rollup_report, rollup_state
+from fragments import cached_fragment
+from throttle import login_throttle
+from sync import change_listeners as sync_change_listeners
+from audit import audited_bulk_update, archive_events, AUDIT_RETENTION_DAYS
+from markupsafe import Markup
+from api import api
+from exporter import request_export_query, equipment_export_query, stream_export, EXPORT_FORMATS
+import click
+import io
 
 
 def validate_password(password):
@@ -34,14 +61,90 @@ def validate_password(password):
     return True, "Password is valid"
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.sqlite3'
+configure_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = 'your-secret-key-here'
 
 db.init_app(app)
 
 with app.app_context():
+    configure_engine(db.engine)
     db.create_all()
+    run_migrations()
+
+init_instrumentation(app)
+app.register_blueprint(api)
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations"""
+    db.create_all()
+    run_migrations()
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute every equipment's request counters from scratch"""
+    refresh_equipment_counters()
+    db.session.commit()
+    print(f"Rebuilt request counters for {Equipment.query.count()} equipment")
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension')
+def import_data_command(kind, path, fmt):
+    """Bulk import equipment, work centers or requests from CSV/JSONL"""
+    with open(path, newline='', encoding='utf-8') as stream:
+        result = import_stream(stream, kind, fmt or detect_format(path))
+    print(f"Imported {result.inserted} {kind}, {result.failed} rows failed")
+    for line, message in sorted(result.errors):
+        print(f"  line {line}: {message}")
+    if result.truncated_errors:
+        print(f"  ... and {result.truncated_errors} more errors")
+
+@app.cli.command('schedule-preventive')
+@click.option('--horizon', default=DEFAULT_HORIZON_DAYS, show_default=True, type=click.IntRange(min=1),
+              help='Days ahead to generate requests for')
+def schedule_preventive_command(horizon):
+    """Generate upcoming preventive requests from the recurrence rules"""
+    result = generate_preventive_requests(horizon)
+    print(f"Created {result.created} preventive requests from {result.rules} due schedules")
+
+@app.cli.command('rebalance-week')
+@click.option('--date', 'day', help='Any day of the week (YYYY-MM-DD), defaults to today')
+def rebalance_week_command(day):
+    """Reassign a week's New requests to the least-loaded free technicians"""
+    start, end = calendar_range('week', parse_date(day, date.today()))
+    window = (datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()))
+    assigned, unassigned = rebalance(*window)
+    db.session.commit()
+    print(f"Week of {start.isoformat()}: assigned {assigned} requests, {unassigned} could not be placed")
+    for technician_id, first_id, second_id in overlapping_bookings(*window):
+        print(f"Technician {technician_id} has overlapping requests #{first_id} and #{second_id}")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Repopulate the full-text search index from the source tables"""
+    if db.engine.dialect.name != 'sqlite':
+        print("The search index is SQLite-only; other databases are searched directly")
+        return
+    with db.engine.begin() as conn:
+        install_search_index(conn)
+    print("Rebuilt the search index")
+
+@app.cli.command('refresh-rollups')
+@click.option('--rebuild', is_flag=True, help='Discard the rollups and recount every request')
+def refresh_rollups_command(rebuild):
+    """Bring the report rollups up to date with changed requests"""
+    result = rebuild_rollups() if rebuild else refresh_rollups()
+    print(f"Recounted {result.days} days for {result.requests} changed requests")
+
+@app.cli.command('archive-audit')
+@click.option('--days', default=AUDIT_RETENTION_DAYS, show_default=True, help='Archive events older than this')
+def archive_audit_command(days):
+    """Move old audit events to the audit_events_archive table"""
+    moved = archive_events(days)
+    print(f"Archived {moved} audit events older than {days} days")
 
 @app.context_processor
 def inject_now():
@@ -56,7 +159,7 @@ def register():
         password = request.form['password']
         
         # Validate email format
-        if not FirebaseAuthService.validate_email(email):
+        if not auth_provider.validate_email(email):
             flash('Please enter a valid email address', 'error')
             return render_template('register.html')
         
@@ -72,8 +175,8 @@ def register():
             flash('Username or email already exists', 'error')
             return render_template('register.html')
         
-        # Create user via Firebase service
-        result = FirebaseAuthService.create_user(email, password, username)
+        # Create user via the configured auth provider
+        result = auth_provider.create_user(email, password, username)
         
         if result['success']:
             flash('Registration successful! Please log in.', 'success')
@@ -89,63 +192,70 @@ def login():
         email = request.form['email']
         password = request.form['password']
         
-        # Verify credentials via Firebase service
-        result = FirebaseAuthService.verify_password(email, password)
+        # Rejected before any password hash is computed
+        retry_after = login_throttle.attempt(email, request.remote_addr)
+        if retry_after:
+            flash(f'Too many login attempts. Try again in {math.ceil(retry_after)} seconds.', 'error')
+            return render_template('login.html'), 429
+        
+        # Verify credentials via the configured auth provider
+        result = auth_provider.verify_password(email, password)
         
         if result['success']:
-            # Find or create user in local database
-            user = User.query.filter_by(email=email).first()
-            if not user:
-                # Create local user if doesn't exist
-                user = User(username=result['username'], email=email)
-                user.set_password(password)  # Store hashed password locally as well
-                db.session.add(user)
-                db.session.commit()
-            
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['role'] = user.role
-            session['firebase_uid'] = result['uid']
-            flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            login_throttle.succeeded(email, request.remote_addr)
+            return start_session(result)
         else:
             flash('Invalid email or password', 'error')
     
     return render_template('login.html')
 
+def login_with_token():
+    """Sign in with an identity token (a Firebase ID token with AUTH_PROVIDER=firebase)"""
+    retry_after = login_throttle.attempt(None, request.remote_addr)
+    if retry_after:
+        flash(f'Too many login attempts. Try again in {math.ceil(retry_after)} seconds.', 'error')
+        return render_template('login.html'), 429
+    
+    result = auth_provider.get_user_by_token(request.form.get('id_token', ''))
+    if not result['success']:
+        flash('Sign-in failed: ' + result['error'], 'error')
+        return redirect(url_for('login'))
+    login_throttle.succeeded(None, request.remote_addr)
+    return start_session(result)
+
+# Only offered by providers that verify identity tokens
+if auth_provider.accepts_tokens:
+    app.add_url_rule('/login/token', view_func=login_with_token, methods=['POST'])
+
+def start_session(result):
+    # Already in the session's identity map from the credential check
+    user = db.session.get(User, result['user_id'])
+    
+    session['user_id'] = user.id
+    session['username'] = user.username
+    session['role'] = user.role
+    session['firebase_uid'] = result['uid']
+    flash('Login successful!', 'success')
+    return redirect(url_for('dashboard'))
+
 @app.route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
-from functools import wraps
-
-# Login required decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Please log in to access this page.', 'error')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-# Check if user is logged in
+# Make the logged-in user available to every template
 @app.context_processor
 def inject_user():
-    user_id = session.get('user_id')
-    if user_id:
-        user = User.query.get(user_id)
-        return {'current_user': user}
-    return {'current_user': None}
+    return {'current_user': load_current_user()}
 
 # Routes for Work Centers
 @app.route('/workcenters')
 @login_required
 def workcenters_list():
-    workcenters = WorkCenter.query.all()
-    return render_template('workcenters.html', workcenters=workcenters)
+    table = cached_fragment('workcenters', ['workcenters'],
+                            lambda: render_template('workcenters_table.html', workcenters=WorkCenter.query.all()))
+    return render_template('workcenters.html', table=Markup(table))
 
 @app.route('/workcenter/new', methods=['GET', 'POST'])
 @login_required
@@ -199,26 +309,195 @@ def delete_workcenter(id):
 def dashboard():
     return redirect(url_for('kanban_board'))
 
+# Cards shown per Kanban column before "Load more"
+KANBAN_PAGE_SIZE = 25
+
+KANBAN_COLUMNS = {
+    'New': {'label': 'New', 'summary': 'New Requests', 'card_class': 'new-card',
+            'empty': 'No new requests', 'next_stage': 'In Progress', 'action': 'Start',
+            'action_class': 'btn-outline-info'},
+    'In Progress': {'label': 'In Progress', 'summary': 'In Progress', 'card_class': 'in-progress-card',
+                    'empty': 'No in-progress requests', 'next_stage': 'Repaired', 'action': 'Complete',
+                    'action_class': 'btn-outline-success'},
+    'Repaired': {'label': 'Repaired', 'summary': 'Repaired', 'card_class': 'repaired-card',
+                 'empty': 'No repaired requests'},
+    'Scrap': {'label': 'Scrap', 'summary': 'Scrapped', 'card_class': 'scrap-card',
+              'empty': 'No scrap requests'},
+}
+
+def kanban_card_query():
+    """Request query with everything a Kanban card displays eager-loaded"""
+    return MaintenanceRequest.query.options(
+        joinedload(MaintenanceRequest.equipment),
+        joinedload(MaintenanceRequest.workcenter),
+        joinedload(MaintenanceRequest.maintenance_team)
+    )
+
+def load_kanban_cards(stages, limit, before_id=None):
+    """
+    Load the newest `limit` cards of each stage in a single query.
+    Returns {stage: (cards, next_cursor)} where next_cursor is the id to
+    continue from, or None when the column is exhausted.
+    """
+    per_stage = []
+    for stage in stages:
+        ids = select(MaintenanceRequest.id).where(MaintenanceRequest.stage == stage)
+        if before_id:
+            ids = ids.where(MaintenanceRequest.id < before_id)
+        # Fetch one extra row per stage to know whether there is more to load
+        ids = ids.order_by(MaintenanceRequest.id.desc()).limit(limit + 1).subquery()
+        per_stage.append(select(ids.c.id))
+    
+    cards = kanban_card_query().filter(
+        MaintenanceRequest.id.in_(union_all(*per_stage))
+    ).order_by(MaintenanceRequest.id.desc()).all()
+    
+    # Partition by stage in Python
+    columns = {stage: [] for stage in stages}
+    for card in cards:
+        columns[card.stage].append(card)
+    
+    result = {}
+    for stage, stage_cards in columns.items():
+        next_cursor = None
+        if len(stage_cards) > limit:
+            stage_cards = stage_cards[:limit]
+            next_cursor = stage_cards[-1].id
+        result[stage] = (stage_cards, next_cursor)
+    return result
+
+# Tables a rendered board reads: cards show equipment, work center and team names
+KANBAN_TABLES = ['maintenance_requests', 'equipment', 'workcenters', 'maintenance_teams']
+
+def stage_counts():
+    return dict(db.session.query(MaintenanceRequest.stage, db.func.count(MaintenanceRequest.id))
+                .group_by(MaintenanceRequest.stage).all())
+
 @app.route('/dashboard')
 @login_required
 def kanban_board():
-    # Get maintenance requests grouped by stage
-    new_requests = MaintenanceRequest.query.filter_by(stage='New').all()
-    in_progress_requests = MaintenanceRequest.query.filter_by(stage='In Progress').all()
-    repaired_requests = MaintenanceRequest.query.filter_by(stage='Repaired').all()
-    scrap_requests = MaintenanceRequest.query.filter_by(stage='Scrap').all()
-    
-    return render_template('dashboard.html', 
-                           new_requests=new_requests,
-                           in_progress_requests=in_progress_requests,
-                           repaired_requests=repaired_requests,
-                           scrap_requests=scrap_requests)
+    board = cached_fragment('dashboard', KANBAN_TABLES, render_kanban_board)
+    return render_template('dashboard.html', board=Markup(board), stream_retry_seconds=STREAM_RETRY_SECONDS)
+
+def render_kanban_board():
+    # Column totals come from one aggregate, cards from one eager-loaded query
+    counts = stage_counts()
+    cards = load_kanban_cards(REQUEST_STAGES, KANBAN_PAGE_SIZE)
+    
+    columns = []
+    for stage in REQUEST_STAGES:
+        stage_cards, next_cursor = cards[stage]
+        columns.append(dict(KANBAN_COLUMNS[stage],
+                            stage=stage,
+                            cards=stage_cards,
+                            count=counts.get(stage, 0),
+                            next_cursor=next_cursor))
+    
+    return render_template('kanban_board.html', columns=columns)
+
+@app.route('/dashboard/column')
+@login_required
+def kanban_column():
+    """Next page of cards for one column (used by the "Load more" button)"""
+    stage = request.args.get('stage')
+    if stage not in KANBAN_COLUMNS:
+        return 'Unknown stage', 400
+    before_id = request.args.get('before', type=int)
+    stage_cards, next_cursor = load_kanban_cards([stage], KANBAN_PAGE_SIZE, before_id)[stage]
+    column = dict(KANBAN_COLUMNS[stage], stage=stage, cards=stage_cards, next_cursor=next_cursor)
+    return render_template('kanban_cards.html', column=column)
+
+def card_change(request_obj):
+    """A request rendered as a ready-to-insert Kanban card"""
+    stage = request_obj.stage if request_obj.stage in KANBAN_COLUMNS else 'New'
+    column = dict(KANBAN_COLUMNS[stage], stage=stage, cards=[request_obj], next_cursor=None)
+    return {
+        'id': request_obj.id,
+        'stage': stage,
+        'html': render_template('kanban_cards.html', column=column)
+    }
+
+def publish_request_change(request_obj):
+    """Send a committed create/update to live dashboards"""
+    if not len(broker):
+        return
+    broker.publish('request_changed', dict(card_change(request_obj), counts=stage_counts()))
+
+def publish_requests_changed(request_ids):
+    """Send a committed bulk update as one event so it can't overflow subscriber queues"""
+    if not len(broker) or not request_ids:
+        return
+    cards = kanban_card_query().filter(MaintenanceRequest.id.in_(request_ids)).all()
+    broker.publish('requests_changed', {
+        'changes': [card_change(request_obj) for request_obj in cards],
+        'counts': stage_counts()
+    })
+
+# Edits synced from offline devices reach open dashboards like any other bulk change
+sync_change_listeners.append(publish_requests_changed)
+
+def publish_request_deleted(request_id):
+    if not len(broker):
+        return
+    broker.publish('request_deleted', {'id': request_id, 'counts': stage_counts()})
+
+@app.route('/dashboard/stream')
+@login_required
+def kanban_stream():
+    """Server-Sent Events stream of board changes"""
+    subscriber = broker.subscribe()
+    if subscriber is None:
+        # Every stream slot is taken; the page falls back to reloading
+        return Response(f'retry: {STREAM_RETRY_SECONDS * 1000}\n\n', 503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(STREAM_RETRY_SECONDS)})
+    # Don't hold a pooled connection for the lifetime of the stream
+    db.session.remove()
+    response = Response(event_stream(subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The generator's own cleanup never runs if the client leaves before the body is iterated
+    response.call_on_close(lambda: broker.unsubscribe(subscriber))
+    return response
+
+# Rows per page on the request and equipment lists
+LIST_PAGE_SIZE = 50
+
+# Sort options for the lists: (unique key columns, descending)
+EQUIPMENT_SORTS = {
+    'name': ([Equipment.name, Equipment.id], False),
+    'serial': ([Equipment.serial_number, Equipment.id], False),
+    'newest': ([Equipment.id], True),
+}
+
+REQUEST_SORTS = {
+    'newest': ([MaintenanceRequest.id], True),
+    'oldest': ([MaintenanceRequest.id], False),
+}
+
+def list_filters(*names):
+    """Non-empty filter values from the query string"""
+    return {name: request.args[name] for name in names if request.args.get(name)}
 
 @app.route('/equipment')
 @login_required
 def equipment_list():
-    equipment = Equipment.query.all()
-    return render_template('equipment_list.html', equipment=equipment)
+    filters = list_filters('category', 'department', 'team')
+    sort = request.args.get('sort', 'name')
+    if sort not in EQUIPMENT_SORTS:
+        sort = 'name'
+    
+    query = Equipment.query
+    if 'category' in filters:
+        query = query.filter_by(category=filters['category'])
+    if 'department' in filters:
+        query = query.filter_by(department=filters['department'])
+    if 'team' in filters:
+        query = query.filter_by(maintenance_team_id=request.args.get('team', type=int))
+    
+    columns, descending = EQUIPMENT_SORTS[sort]
+    equipment = paginate_keyset(query, columns, request.args.get('cursor'), LIST_PAGE_SIZE, descending)
+    teams = MaintenanceTeam.query.order_by(MaintenanceTeam.name).all()
+    return render_template('equipment_list.html', equipment=equipment, filters=filters,
+                           sort=sort, teams=teams)
 
 @app.route('/equipment/<int:id>')
 @login_required
@@ -245,20 +524,20 @@ def create_equipment():
             category=request.form['category'],
             department=request.form['department'],
             assigned_employee=request.form.get('assigned_employee'),
-            maintenance_team_id=request.form.get('maintenance_team_id'),
-            default_technician=request.form.get('default_technician'),
+            maintenance_team_id=request.form.get('maintenance_team_id', type=int),
             purchase_date=datetime.strptime(request.form['purchase_date'], '%Y-%m-%d').date() if request.form.get('purchase_date') else None,
             warranty_end=datetime.strptime(request.form['warranty_end'], '%Y-%m-%d').date() if request.form.get('warranty_end') else None,
             location=request.form.get('location'),
-            notes=request.form.get('notes')
+            notes=request.form.get('notes'),
+            operating_hours=request.form.get('operating_hours', 0, type=float)
         )
+        equipment.set_technician(find_or_create_technician(request.form.get('default_technician')))
         db.session.add(equipment)
         db.session.commit()
         flash('Equipment created successfully!', 'success')
         return redirect(url_for('equipment_list'))
     
-    teams = MaintenanceTeam.query.all()
-    return render_template('equipment_form.html', teams=teams)
+    return render_template('equipment_form.html')
 
 @app.route('/equipment/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -271,26 +550,51 @@ def edit_equipment(id):
         equipment.category = request.form['category']
         equipment.department = request.form['department']
         equipment.assigned_employee = request.form.get('assigned_employee')
-        equipment.maintenance_team_id = request.form.get('maintenance_team_id')
-        equipment.default_technician = request.form.get('default_technician')
+        equipment.maintenance_team_id = request.form.get('maintenance_team_id', type=int)
+        equipment.set_technician(find_or_create_technician(request.form.get('default_technician')))
         equipment.purchase_date = datetime.strptime(request.form['purchase_date'], '%Y-%m-%d').date() if request.form.get('purchase_date') else None
         equipment.warranty_end = datetime.strptime(request.form['warranty_end'], '%Y-%m-%d').date() if request.form.get('warranty_end') else None
         equipment.location = request.form.get('location')
         equipment.notes = request.form.get('notes')
+        equipment.operating_hours = request.form.get('operating_hours', equipment.operating_hours, type=float)
         
         db.session.commit()
         flash('Equipment updated successfully!', 'success')
         return redirect(url_for('equipment_list'))
     
-    teams = MaintenanceTeam.query.all()
-    return render_template('equipment_form.html', equipment=equipment, teams=teams)
+    return render_template('equipment_form.html', equipment=equipment)
+
+def parse_datetime(value):
+    """Parse a datetime-local ('YYYY-MM-DDTHH:MM') or 'YYYY-MM-DD HH:MM' string, None if invalid"""
+    for fmt in ('%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
 
 # Routes for Maintenance Requests
 @app.route('/requests')
 @login_required
 def maintenance_requests():
-    requests = MaintenanceRequest.query.all()
-    return render_template('requests_list.html', requests=requests)
+    filters = list_filters('stage', 'team', 'category')
+    sort = request.args.get('sort', 'newest')
+    if sort not in REQUEST_SORTS:
+        sort = 'newest'
+    
+    query = MaintenanceRequest.query.options(joinedload(MaintenanceRequest.equipment))
+    if 'stage' in filters:
+        query = query.filter_by(stage=filters['stage'])
+    if 'team' in filters:
+        query = query.filter_by(maintenance_team_id=request.args.get('team', type=int))
+    if 'category' in filters:
+        query = query.filter_by(category=filters['category'])
+    
+    columns, descending = REQUEST_SORTS[sort]
+    requests = paginate_keyset(query, columns, request.args.get('cursor'), LIST_PAGE_SIZE, descending)
+    teams = MaintenanceTeam.query.order_by(MaintenanceTeam.name).all()
+    return render_template('requests_list.html', requests=requests, filters=filters,
+                           sort=sort, teams=teams, stages=REQUEST_STAGES)
 
 @app.route('/request/new', methods=['GET', 'POST'])
 @login_required
@@ -299,14 +603,7 @@ def create_request():
         # Determine if request is for equipment or work center
         request_for = request.form.get('request_for')  # 'equipment' or 'workcenter'
         
-        scheduled_date_str = request.form.get('scheduled_date')
-        scheduled_date = None
-        if scheduled_date_str:
-            try:
-                scheduled_date = datetime.strptime(scheduled_date_str, '%Y-%m-%d %H:%M')
-            except ValueError:
-                # Handle potential parsing errors
-                pass
+        scheduled_date = parse_datetime(request.form.get('scheduled_date'))
         
         # Create request object
         request_obj = MaintenanceRequest(
@@ -314,37 +611,34 @@ def create_request():
             request_type=request.form['request_type'],
             scheduled_date=scheduled_date,
             duration_hours=float(request.form.get('duration_hours', 0)) if request.form.get('duration_hours') else None,
-            stage='New',  # Default stage
-            assigned_technician=request.form.get('assigned_technician')
+            stage='New'  # Default stage
         )
         
         # Set category and maintenance team based on request type
-        if request_for == 'equipment' and request.form.get('equipment_id'):
-            equipment = Equipment.query.get(request.form['equipment_id'])
-            request_obj.equipment_id = request.form['equipment_id']
+        if request_for == 'equipment' and request.form.get('equipment_id', type=int):
+            request_obj.equipment_id = request.form.get('equipment_id', type=int)
+            equipment = Equipment.query.get(request_obj.equipment_id)
             request_obj.category = equipment.category if equipment else None
             request_obj.maintenance_team_id = equipment.maintenance_team_id if equipment else None
-            if not request_obj.assigned_technician:
-                request_obj.assigned_technician = equipment.default_technician if equipment else None
-        elif request_for == 'workcenter' and request.form.get('workcenter_id'):
-            workcenter = WorkCenter.query.get(request.form['workcenter_id'])
-            request_obj.workcenter_id = request.form['workcenter_id']
+        elif request_for == 'workcenter' and request.form.get('workcenter_id', type=int):
+            request_obj.workcenter_id = request.form.get('workcenter_id', type=int)
+            workcenter = WorkCenter.query.get(request_obj.workcenter_id)
             request_obj.category = workcenter.department if workcenter else None
             # You can set maintenance team based on workcenter if needed
         
+        # Left blank: the least-loaded team member who is free at that time
+        technician = find_or_create_technician(request.form.get('assigned_technician'))
+        request_obj.set_technician(technician or auto_assign(request_obj))
+        
         db.session.add(request_obj)
+        refresh_equipment_counters([request_obj.equipment_id])
         db.session.commit()
         
+        publish_request_change(request_obj)
         flash('Maintenance request created successfully!', 'success')
         return redirect(url_for('maintenance_requests'))
     
-    equipment_list = Equipment.query.all()
-    workcenters_list = WorkCenter.query.all()
-    teams = MaintenanceTeam.query.all()
-    return render_template('request_form.html', 
-                           equipment_list=equipment_list, 
-                           workcenters_list=workcenters_list,
-                           teams=teams)
+    return render_template('request_form.html', request=None)
 
 @app.route('/request/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -352,6 +646,8 @@ def edit_request(id):
     request_obj = MaintenanceRequest.query.get_or_404(id)
     
     if request.method == 'POST':
+        previous_equipment_id = request_obj.equipment_id
+        
         # Update the request
         request_obj.subject = request.form['subject']
         request_obj.request_type = request.form['request_type']
@@ -363,26 +659,23 @@ def edit_request(id):
         request_obj.equipment_id = None
         request_obj.workcenter_id = None
         
-        # Set appropriate ID based on request type
-        if request_for == 'equipment' and request.form.get('equipment_id'):
-            request_obj.equipment_id = request.form['equipment_id']
+        # Set appropriate ID based on request type (as ints, so an unchanged id isn't seen as a change)
+        if request_for == 'equipment' and request.form.get('equipment_id', type=int):
+            request_obj.equipment_id = request.form.get('equipment_id', type=int)
             equipment = Equipment.query.get(request_obj.equipment_id)
             request_obj.category = equipment.category if equipment else None
             request_obj.maintenance_team_id = equipment.maintenance_team_id if equipment else None
-        elif request_for == 'workcenter' and request.form.get('workcenter_id'):
-            request_obj.workcenter_id = request.form['workcenter_id']
+        elif request_for == 'workcenter' and request.form.get('workcenter_id', type=int):
+            request_obj.workcenter_id = request.form.get('workcenter_id', type=int)
             workcenter = WorkCenter.query.get(request_obj.workcenter_id)
             request_obj.category = workcenter.department if workcenter else None
         
-        request_obj.assigned_technician = request.form.get('assigned_technician')
-        scheduled_date_str = request.form.get('scheduled_date')
-        if scheduled_date_str:
-            try:
-                request_obj.scheduled_date = datetime.strptime(scheduled_date_str, '%Y-%m-%d %H:%M')
-            except ValueError:
-                request_obj.scheduled_date = None
-        else:
-            request_obj.scheduled_date = None
+        request_obj.set_technician(find_or_create_technician(request.form.get('assigned_technician')))
+        scheduled_date = parse_datetime(request.form.get('scheduled_date'))
+        # The form shows minutes only; keep the stored seconds when the minute is unchanged
+        if not (scheduled_date and request_obj.scheduled_date
+                and scheduled_date == request_obj.scheduled_date.replace(second=0, microsecond=0)):
+            request_obj.scheduled_date = scheduled_date
         request_obj.duration_hours = float(request.form.get('duration_hours', 0)) if request.form.get('duration_hours') else None
         request_obj.stage = request.form['stage']
         
@@ -393,18 +686,13 @@ def edit_request(id):
                 equipment.status = 'Scrapped'
                 equipment.notes = f"Marked as scrapped due to maintenance request: {request_obj.subject}"
         
+        refresh_equipment_counters([previous_equipment_id, request_obj.equipment_id])
         db.session.commit()
+        publish_request_change(request_obj)
         flash('Maintenance request updated successfully!', 'success')
         return redirect(url_for('maintenance_requests'))
     
-    equipment_list = Equipment.query.all()
-    workcenters_list = WorkCenter.query.all()
-    teams = MaintenanceTeam.query.all()
-    return render_template('request_form.html', 
-                           request=request_obj, 
-                           equipment_list=equipment_list, 
-                           workcenters_list=workcenters_list,
-                           teams=teams)
+    return render_template('request_form.html', request=request_obj)
 
 @app.route('/request/<int:id>/update_stage', methods=['POST'])
 @login_required
@@ -422,10 +710,163 @@ def update_request_stage(id):
             equipment.status = 'Scrapped'
             equipment.notes = f"Marked as scrapped due to maintenance request: {request_obj.subject}"
     
+    refresh_equipment_counters([request_obj.equipment_id])
     db.session.commit()
+    publish_request_change(request_obj)
+    
+    # The board posts in the background and picks the change up from its event stream
+    if request.headers.get('X-Requested-With') == 'fetch':
+        return '', 204
     flash('Request stage updated successfully!', 'success')
     return redirect(url_for('kanban_board'))
 
+# Most requests one bulk transition may touch (keeps the IN list well under SQLite's parameter limit)
+BULK_STAGE_MAX = 1000
+
+def scrap_equipment_update(request_ids):
+    """
+    Set-based version of the Scrap side effect: mark the equipment of every
+    listed request as scrapped, noting the newest scrapping request's subject.
+    """
+    scrapping = (select(literal('Marked as scrapped due to maintenance request: ')
+                        + MaintenanceRequest.subject)
+                 .where(MaintenanceRequest.id.in_(request_ids),
+                        MaintenanceRequest.equipment_id == Equipment.id)
+                 .order_by(MaintenanceRequest.id.desc())
+                 .limit(1)
+                 .scalar_subquery())
+    return (update(Equipment)
+            .where(Equipment.id.in_(select(MaintenanceRequest.equipment_id)
+                                    .where(MaintenanceRequest.id.in_(request_ids))))
+            .values(status='Scrapped', notes=scrapping))
+
+def bulk_update_stage(request_ids, new_stage):
+    """
+    Move many requests to `new_stage` in one transaction with a single
+    UPDATE ... WHERE id IN. Returns {id: 'updated' | 'unchanged' | 'not_found'}.
+    """
+    found = db.session.execute(
+        select(MaintenanceRequest.id, MaintenanceRequest.stage, MaintenanceRequest.equipment_id)
+        .where(MaintenanceRequest.id.in_(request_ids))).all()
+    results = {request_id: 'not_found' for request_id in request_ids}
+    changed = []
+    equipment_ids = set()
+    for row in found:
+        if row.stage == new_stage:
+            results[row.id] = 'unchanged'
+        else:
+            results[row.id] = 'updated'
+            changed.append(row.id)
+            equipment_ids.add(row.equipment_id)
+    
+    if changed:
+        # Same completed_at rule as the ORM stage listener: set on closing, kept across closed stages
+        completed_at = (db.func.coalesce(MaintenanceRequest.completed_at, datetime.utcnow())
+                        if new_stage in CLOSED_STAGES else None)
+        with audited_bulk_update(MaintenanceRequest, changed):
+            db.session.execute(update(MaintenanceRequest)
+                               .where(MaintenanceRequest.id.in_(changed))
+                               .values(stage=new_stage, completed_at=completed_at),
+                               execution_options={'synchronize_session': False})
+        if new_stage == 'Scrap':
+            with audited_bulk_update(Equipment, equipment_ids):
+                db.session.execute(scrap_equipment_update(changed),
+                                   execution_options={'synchronize_session': False})
+        refresh_equipment_counters(equipment_ids)
+    db.session.commit()
+    publish_requests_changed(changed)
+    return results
+
+@app.route('/requests/stage', methods=['POST'])
+@login_required
+def update_request_stages():
+    """Bulk stage transition from a form (ids, stage) or JSON {"ids": [...], "stage": ...}"""
+    wants_json = request.is_json or request.headers.get('X-Requested-With') == 'fetch'
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        raw_ids, new_stage = payload.get('ids') or [], payload.get('stage')
+    else:
+        raw_ids, new_stage = request.form.getlist('ids'), request.form.get('stage')
+    
+    error = None
+    try:
+        request_ids = list(dict.fromkeys(int(request_id) for request_id in raw_ids))
+    except (TypeError, ValueError):
+        request_ids, error = [], 'Request ids must be integers'
+    if not error and new_stage not in REQUEST_STAGES:
+        error = 'Choose a valid stage'
+    elif not error and not request_ids:
+        error = 'Select at least one request'
+    elif not error and len(request_ids) > BULK_STAGE_MAX:
+        error = f'At most {BULK_STAGE_MAX} requests can be moved at once'
+    if error:
+        if wants_json:
+            return jsonify({'error': error}), 400
+        flash(error, 'error')
+        return redirect(request.referrer or url_for('maintenance_requests'))
+    
+    results = bulk_update_stage(request_ids, new_stage)
+    if wants_json:
+        return jsonify({'stage': new_stage,
+                        'results': [{'id': request_id, 'status': status}
+                                    for request_id, status in results.items()]})
+    updated = sum(1 for status in results.values() if status == 'updated')
+    missing = sum(1 for status in results.values() if status == 'not_found')
+    flash(f'Moved {updated} request(s) to {new_stage}'
+          + (f', {missing} not found' if missing else ''), 'success' if not missing else 'error')
+    return redirect(request.referrer or url_for('maintenance_requests'))
+
+# Bulk import
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    result = None
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            flash('Choose what to import and a CSV or JSONL file', 'error')
+            return render_template('import.html', kinds=IMPORT_KINDS)
+        
+        # Read the upload as a text stream instead of loading it into memory
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        try:
+            result = import_stream(stream, kind, detect_format(upload.filename))
+        except UnicodeDecodeError:
+            flash('The file must be UTF-8 encoded', 'error')
+            return render_template('import.html', kinds=IMPORT_KINDS)
+        flash(f'Imported {result.inserted} rows, {result.failed} failed',
+              'success' if not result.failed else 'error')
+    return render_template('import.html', kinds=IMPORT_KINDS, result=result)
+
+# Streaming exports
+def export_response(stmt, name, fmt):
+    filename = f"{name}-{date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(stream_export(stmt, fmt)),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/export/requests.<fmt>')
+@login_required
+def export_requests(fmt):
+    if fmt not in EXPORT_FORMATS:
+        return 'Unsupported export format', 404
+    stmt = request_export_query(start=parse_date(request.args.get('start')),
+                                end=parse_date(request.args.get('end')),
+                                stage=request.args.get('stage') or None,
+                                team_id=request.args.get('team', type=int))
+    return export_response(stmt, 'maintenance-requests', fmt)
+
+@app.route('/export/equipment.<fmt>')
+@login_required
+def export_equipment(fmt):
+    if fmt not in EXPORT_FORMATS:
+        return 'Unsupported export format', 404
+    stmt = equipment_export_query(start=parse_date(request.args.get('start')),
+                                  end=parse_date(request.args.get('end')),
+                                  team_id=request.args.get('team', type=int))
+    return export_response(stmt, 'equipment', fmt)
+
 # Worksheets view
 @app.route('/worksheets')
 @login_required
@@ -440,54 +881,300 @@ def create_worksheet():
     return redirect(url_for('worksheets'))
 
 # Calendar view for preventive maintenance
+CALENDAR_VIEWS = ('month', 'week', 'day')
+
+# Longest range the events feed will serve (a 6-week month grid)
+CALENDAR_MAX_DAYS = 42
+
+def parse_date(value, default=None):
+    """Parse a YYYY-MM-DD string, falling back to default"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return default
+
+def calendar_range(view, anchor):
+    """Return (start, end) dates of the view containing anchor, end exclusive"""
+    if view == 'day':
+        return anchor, anchor + timedelta(days=1)
+    if view == 'week':
+        # Weeks start on Sunday to match the calendar headers
+        start = anchor - timedelta(days=(anchor.weekday() + 1) % 7)
+        return start, start + timedelta(days=7)
+    start = anchor.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
 @app.route('/calendar')
 @login_required
 def calendar_view():
-    # Get all maintenance requests with scheduled dates
-    all_requests = MaintenanceRequest.query.filter(MaintenanceRequest.scheduled_date.isnot(None)).all()
-    
-    # Group requests by date
-    requests_by_date = {}
-    for request in all_requests:
-        if request.scheduled_date:
-            date_key = request.scheduled_date.strftime('%Y-%m-%d')
-            if date_key not in requests_by_date:
-                requests_by_date[date_key] = []
-            requests_by_date[date_key].append(request)
-    
-    # Get current month/year for calendar
-    import calendar
-    from datetime import date
+    view = request.args.get('view', 'month')
+    if view not in CALENDAR_VIEWS:
+        view = 'month'
+    anchor = parse_date(request.args.get('date'), date.today())
+    start, end = calendar_range(view, anchor)
     
-    today = date.today()
-    current_month = today.month
-    current_year = today.year
+    # Only the grid is rendered here; events are fetched for the range from calendar_events
+    if view == 'month':
+        weeks = [[day if day.month == start.month else None for day in week]
+                 for week in calendar.Calendar(firstweekday=6).monthdatescalendar(start.year, start.month)]
+        title = f"{calendar.month_name[start.month]} {start.year}"
+        previous = (start - timedelta(days=1)).replace(day=1)
+    elif view == 'week':
+        weeks = [[start + timedelta(days=i) for i in range(7)]]
+        title = f"Week of {start.strftime('%B %d, %Y')}"
+        previous = start - timedelta(days=7)
+    else:
+        weeks = [[start]]
+        title = start.strftime('%A, %B %d, %Y')
+        previous = start - timedelta(days=1)
+    
+    return render_template('calendar.html',
+                           view=view,
+                           weeks=weeks,
+                           title=title,
+                           anchor=anchor,
+                           range_start=start,
+                           range_end=end,
+                           previous=previous,
+                           next=end,
+                           today=date.today())
+
+@app.route('/calendar/events')
+@login_required
+def calendar_events():
+    """JSON feed of scheduled requests in [start, end)"""
+    start = parse_date(request.args.get('start'))
+    end = parse_date(request.args.get('end'))
+    if not start or not end or end <= start:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates with start < end'}), 400
+    if (end - start).days > CALENDAR_MAX_DAYS:
+        return jsonify({'error': f'range must not exceed {CALENDAR_MAX_DAYS} days'}), 400
     
-    # Generate calendar for current month
-    cal = calendar.monthcalendar(current_year, current_month)
+    body = cached_fragment('calendar-events', ['maintenance_requests', 'equipment', 'workcenters'],
+                           lambda: app.json.dumps(load_calendar_events(start, end)), start, end)
+    return Response(body, mimetype='application/json')
+
+def load_calendar_events(start, end):
+    events = MaintenanceRequest.query.options(
+        joinedload(MaintenanceRequest.equipment),
+        joinedload(MaintenanceRequest.workcenter)
+    ).filter(
+        MaintenanceRequest.scheduled_date >= datetime.combine(start, datetime.min.time()),
+        MaintenanceRequest.scheduled_date < datetime.combine(end, datetime.min.time())
+    ).order_by(MaintenanceRequest.scheduled_date).all()
     
-    return render_template('calendar.html', 
-                           requests_by_date=requests_by_date,
-                           calendar=cal,
-                           current_month=current_month,
-                           current_year=current_year,
-                           month_name=calendar.month_name[current_month])
+    return [{
+        'id': event.id,
+        'subject': event.subject,
+        'start': event.scheduled_date.isoformat(),
+        'date': event.scheduled_date.strftime('%Y-%m-%d'),
+        'duration_hours': event.duration_hours,
+        'stage': event.stage,
+        'request_type': event.request_type,
+        'equipment': event.equipment.name if event.equipment else None,
+        'workcenter': event.workcenter.name if event.workcenter else None,
+        'url': url_for('edit_request', id=event.id)
+    } for event in events]
+
+@app.route('/calendar/rebalance', methods=['POST'])
+@login_required
+def rebalance_week():
+    """Reassign the week's New requests across each team without overlaps"""
+    start, end = calendar_range('week', parse_date(request.form.get('date'), date.today()))
+    window = (datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()))
+    assigned, unassigned = rebalance(*window)
+    db.session.commit()
+    flash(f'Assigned {assigned} requests for the week of {start.isoformat()}'
+          + (f', {unassigned} could not be placed' if unassigned else ''),
+          'success' if not unassigned else 'error')
+    # Rebalancing never creates overlaps; any left were booked by hand or are already in progress
+    overlaps = overlapping_bookings(*window)
+    if overlaps:
+        flash(f'{len(overlaps)} overlapping bookings remain in this week, e.g. requests '
+              f'#{overlaps[0][1]} and #{overlaps[0][2]}', 'error')
+    return redirect(url_for('calendar_view', view='week', date=start.isoformat()))
+
+# Full-text search
+SEARCH_PAGE_SIZE = 50
+SUGGEST_LIMIT = 10
+
+def search_result_url(result):
+    if result['kind'] == 'request':
+        return url_for('edit_request', id=result['id'])
+    if result['kind'] == 'equipment':
+        return url_for('equipment_detail', id=result['id'])
+    return url_for('edit_workcenter', id=result['id'])
+
+@app.route('/search')
+@login_required
+def search_page():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    results = search(query, kind, SEARCH_PAGE_SIZE) if query else []
+    for result in results:
+        result['url'] = search_result_url(result)
+    return render_template('search.html', query=query, kind=kind, kinds=SEARCH_KINDS, results=results)
+
+@app.route('/search/suggest')
+@login_required
+def search_suggest():
+    """Typeahead: the best few matches for a partial query as JSON"""
+    results = search(request.args.get('q', ''), request.args.get('kind') or None, SUGGEST_LIMIT,
+                     candidates=SUGGEST_CANDIDATES)
+    for result in results:
+        result['url'] = search_result_url(result)
+    return jsonify(results)
+
+@app.route('/lookup/<kind>')
+@login_required
+def lookup_options(kind):
+    """Form pickers: options of one kind matching a partial query as JSON"""
+    if kind not in LOOKUPS:
+        abort(404)
+    return jsonify(lookup(kind, request.args.get('q', ''),
+                          request.args.get('limit', DEFAULT_LOOKUP_LIMIT, type=int)))
+
+# Preventive maintenance schedules
+@app.route('/schedules', methods=['GET', 'POST'])
+@login_required
+def schedules():
+    if request.method == 'POST':
+        unit = request.form.get('unit')
+        interval = request.form.get('interval', type=int)
+        equipment = db.session.get(Equipment, request.form.get('equipment_id', type=int) or 0)
+        workcenter = db.session.get(WorkCenter, request.form.get('workcenter_id', type=int) or 0)
+        error = None
+        if unit not in RECURRENCE_UNITS or not interval or interval < 1:
+            error = 'Choose a repeat interval of at least 1'
+        elif (equipment is None) == (workcenter is None):
+            error = 'Choose either a piece of equipment or a work center'
+        elif unit == 'hours' and equipment is None:
+            error = 'Operating-hour schedules need a piece of equipment'
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('schedules'))
+        
+        rule = RecurrenceRule(
+            name=request.form['name'],
+            equipment_id=equipment.id if equipment else None,
+            workcenter_id=workcenter.id if workcenter else None,
+            category=request.form.get('category') or None,
+            duration_hours=request.form.get('duration_hours', type=float),
+            interval=interval,
+            unit=unit
+        )
+        if unit == 'hours':
+            rule.next_due_hours = equipment.operating_hours + interval
+        else:
+            first_due = parse_date(request.form.get('first_due'), date.today())
+            rule.next_due = datetime.combine(first_due, datetime.min.time())
+        db.session.add(rule)
+        db.session.commit()
+        flash('Schedule created successfully!', 'success')
+        return redirect(url_for('schedules'))
+    
+    query = RecurrenceRule.query.options(joinedload(RecurrenceRule.equipment),
+                                         joinedload(RecurrenceRule.workcenter))
+    rules = paginate_keyset(query, [RecurrenceRule.id], request.args.get('cursor'), LIST_PAGE_SIZE, True)
+    return render_template('schedules.html', rules=rules, units=RECURRENCE_UNITS,
+                           horizon=DEFAULT_HORIZON_DAYS)
+
+@app.route('/schedule/<int:id>/toggle', methods=['POST'])
+@login_required
+def toggle_schedule(id):
+    rule = RecurrenceRule.query.get_or_404(id)
+    rule.active = not rule.active
+    db.session.commit()
+    flash(f"Schedule {'resumed' if rule.active else 'paused'}", 'success')
+    return redirect(url_for('schedules'))
+
+@app.route('/schedule/<int:id>/delete', methods=['POST'])
+@login_required
+def delete_schedule(id):
+    rule = RecurrenceRule.query.get_or_404(id)
+    # Requests already generated stay on the board as one-off preventive work
+    MaintenanceRequest.query.filter_by(recurrence_rule_id=id).update(
+        {'recurrence_rule_id': None}, synchronize_session=False)
+    db.session.delete(rule)
+    db.session.commit()
+    flash('Schedule deleted successfully!', 'success')
+    return redirect(url_for('schedules'))
+
+@app.route('/schedules/generate', methods=['POST'])
+@login_required
+def generate_schedules():
+    horizon = request.form.get('horizon', DEFAULT_HORIZON_DAYS, type=int)
+    result = generate_preventive_requests(max(horizon, 1))
+    flash(f'Created {result.created} preventive requests from {result.rules} schedules', 'success')
+    return redirect(url_for('schedules'))
+
+# Reports, served from the daily rollups only
+REPORT_MONTHS = 12
+REPORT_TOP_EQUIPMENT = 10
+
+@app.route('/reports')
+@login_required
+def reports():
+    today = date.today()
+    end = parse_date(request.args.get('end'), today)
+    # Default to the REPORT_MONTHS calendar months up to and including end's
+    first_month = end.year * 12 + end.month - REPORT_MONTHS
+    default_start = date(first_month // 12, first_month % 12 + 1, 1)
+    start = parse_date(request.args.get('start'), default_start)
+    return render_template('reports.html', start=start, end=end, state=rollup_state(),
+                           monthly=rollup_report(None, start, end, 'month'),
+                           stages=rollup_report('stage', start, end, 'total'),
+                           teams=rollup_report('team', start, end, 'total'),
+                           categories=rollup_report('category', start, end, 'total'),
+                           technicians=rollup_report('technician', start, end, 'total'),
+                           equipment=rollup_report('equipment', start, end, 'total',
+                                                   limit=REPORT_TOP_EQUIPMENT))
+
+@app.route('/reports/refresh', methods=['POST'])
+@login_required
+def refresh_reports():
+    result = refresh_rollups()
+    flash(f'Reports updated: recounted {result.days} days for {result.requests} changed requests', 'success')
+    return redirect(url_for('reports', **request.args))
 
 @app.route('/teams')
 @login_required
 def teams_list():
-    teams = MaintenanceTeam.query.all()
-    return render_template('teams.html', teams=teams)
+    grid = cached_fragment('teams', ['maintenance_teams', 'technicians', 'team_memberships', 'maintenance_requests'],
+                           render_teams_grid)
+    return render_template('teams.html', grid=Markup(grid))
+
+def render_teams_grid():
+    teams = MaintenanceTeam.query.options(selectinload(MaintenanceTeam.technicians)).all()
+    # Open work per technician from the (assigned_technician_id, stage) index
+    open_work = dict(db.session.query(MaintenanceRequest.assigned_technician_id, db.func.count(MaintenanceRequest.id))
+                     .filter(MaintenanceRequest.assigned_technician_id.isnot(None),
+                             MaintenanceRequest.stage.in_(OPEN_STAGES))
+                     .group_by(MaintenanceRequest.assigned_technician_id).all())
+    return render_template('teams_grid.html', teams=teams, open_work=open_work)
+
+@app.route('/technician/<int:id>')
+@login_required
+def technician_queue(id):
+    """A technician's open work, soonest first"""
+    technician = Technician.query.get_or_404(id)
+    queue = (MaintenanceRequest.query
+             .options(joinedload(MaintenanceRequest.equipment), joinedload(MaintenanceRequest.workcenter))
+             .filter(MaintenanceRequest.assigned_technician_id == id,
+                     MaintenanceRequest.stage.in_(OPEN_STAGES))
+             .order_by(MaintenanceRequest.scheduled_date.is_(None), MaintenanceRequest.scheduled_date,
+                       MaintenanceRequest.id)
+             .all())
+    return render_template('technician_queue.html', technician=technician, queue=queue)
 
 @app.route('/create_team', methods=['GET', 'POST'])
 @login_required
 def create_team():
     if request.method == 'POST':
-        team = MaintenanceTeam(
-            name=request.form['name'],
-            members=request.form['members']
-        )
+        team = MaintenanceTeam(name=request.form['name'])
         db.session.add(team)
+        set_team_members(team, request.form['members'])
         db.session.commit()
         flash('Team created successfully!', 'success')
         return redirect(url_for('teams_list'))
@@ -508,8 +1195,11 @@ def delete_equipment(id):
 @login_required
 def delete_request(id):
     request_obj = MaintenanceRequest.query.get_or_404(id)
+    equipment_id = request_obj.equipment_id
     db.session.delete(request_obj)
+    refresh_equipment_counters([equipment_id])
     db.session.commit()
+    publish_request_deleted(id)
     flash('Request deleted successfully!', 'success')
     return redirect(url_for('maintenance_requests'))
 
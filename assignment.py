@@ -0,0 +1,280 @@
+"""
+Capacity-aware technician assignment.
+
+A request is qualified for the active technicians of its maintenance team. Each
+technician's booked time is kept as sorted, disjoint intervals, so checking
+a slot for overlaps is a binary search. Per team, a heap ordered by booked
+hours yields the least-loaded member first. Assigning n jobs therefore takes
+O(n log n) comparisons plus the initial sort of the existing bookings, instead
+of rescanning every technician's requests for every job. Booking a slot
+inserts into Python lists, which shifts the later entries: linear in one
+technician's bookings for the window, but a memmove over at most a few
+hundred entries, so it doesn't show next to the searches.
+
+The planner works over one window (e.g. a week). Open requests already
+assigned inside it count as booked time, and scheduled requests are placed
+only where they don't overlap another booking. Unscheduled requests only
+count towards load. While a rebalance moves requests, each one keeps its
+current slot blocked (held) until it is placed again, so a request that
+can't be placed anywhere never ends up overlapping work moved in around it.
+"""
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from sqlalchemy import select, bindparam
+from models import db, MaintenanceRequest, Technician, team_memberships
+from audit import audited_bulk_update
+
+# Duration assumed for requests that don't give one
+DEFAULT_DURATION_HOURS = 1.0
+# How far before the window to look for jobs that may still be running in it
+BOOKING_LOOKBACK = timedelta(days=1)
+OPEN_STAGES = ('New', 'In Progress')
+PLANNING_WINDOW = timedelta(days=7)
+
+
+def team_members(team_ids=None):
+    """{team id: [(technician id, name), ...]} of active technicians, in name order"""
+    query = (select(team_memberships.c.team_id, Technician.id, Technician.name)
+             .join(Technician, Technician.id == team_memberships.c.technician_id)
+             .where(Technician.active)
+             .order_by(Technician.name))
+    if team_ids is not None:
+        query = query.where(team_memberships.c.team_id.in_(team_ids))
+    members = {}
+    for team_id, technician_id, name in db.session.execute(query):
+        members.setdefault(team_id, []).append((technician_id, name))
+    return members
+
+
+def job_hours(duration_hours):
+    return duration_hours if duration_hours and duration_hours > 0 else DEFAULT_DURATION_HOURS
+
+
+class Bookings:
+    """One technician's booked time as sorted, disjoint [start, end) intervals"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.hours = 0.0
+        # Slots of requests being reassigned, sorted by start: (start, end, request id). They may overlap.
+        self.held = []
+        self.longest_hold = timedelta(0)
+        # Requests whose held slots are released; is_free() skips them instead of removing them
+        self.released = set()
+
+    def load(self, intervals):
+        """Replace the bookings with `intervals`, merging any that overlap"""
+        self.starts, self.ends = [], []
+        for start, end in sorted(intervals):
+            if self.ends and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def is_free(self, start, end, ignore=None):
+        """Whether [start, end) overlaps no booking and no held slot other than request `ignore`'s"""
+        # Only the last interval starting before `end` can overlap, since intervals are disjoint
+        index = bisect_left(self.starts, end)
+        if index and self.ends[index - 1] > start:
+            return False
+        # Held slots can overlap each other: check back to the earliest start that could reach `start`
+        index = bisect_left(self.held, (end,))
+        while index:
+            index -= 1
+            held_start, held_end, request_id = self.held[index]
+            if held_start + self.longest_hold <= start:
+                break
+            if held_end > start and request_id != ignore and request_id not in self.released:
+                return False
+        return True
+
+    def book(self, start, end):
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+    def hold(self, request_id, start, end):
+        insort(self.held, (start, end, request_id))
+        self.longest_hold = max(self.longest_hold, end - start)
+
+    def unhold(self, request_id):
+        self.released.add(request_id)
+
+
+class AssignmentPlanner:
+    """Least-loaded, non-overlapping placement of requests within [window_start, window_end)"""
+
+    def __init__(self, window_start, window_end, team_ids=None):
+        self.window_start = window_start
+        self.window_end = window_end
+        members = team_members(team_ids)
+        self.members = {team_id: [technician_id for technician_id, _ in technicians]
+                        for team_id, technicians in members.items()}
+        self.names = {technician_id: name for technicians in members.values()
+                      for technician_id, name in technicians}
+        self.bookings = {technician_id: Bookings() for technician_id in self.names}
+        self._heaps = {}
+        self._holders = {}
+        self._load_bookings(set(self.bookings))
+
+    def _load_bookings(self, technicians, exclude_ids=()):
+        if not technicians:
+            return
+        rows = db.session.execute(
+            select(MaintenanceRequest.id, MaintenanceRequest.assigned_technician_id,
+                   MaintenanceRequest.scheduled_date, MaintenanceRequest.duration_hours)
+            .where(MaintenanceRequest.assigned_technician_id.in_(technicians),
+                   MaintenanceRequest.stage.in_(OPEN_STAGES),
+                   MaintenanceRequest.scheduled_date >= self.window_start - BOOKING_LOOKBACK,
+                   MaintenanceRequest.scheduled_date < self.window_end)).all()
+        intervals = {technician_id: [] for technician_id in technicians}
+        for row in rows:
+            if row.id in exclude_ids:
+                continue
+            hours = job_hours(row.duration_hours)
+            intervals[row.assigned_technician_id].append(
+                (row.scheduled_date, row.scheduled_date + timedelta(hours=hours)))
+            if row.scheduled_date >= self.window_start:
+                self.bookings[row.assigned_technician_id].hours += hours
+        for technician_id, booked in intervals.items():
+            self.bookings[technician_id].load(booked)
+
+    def hold(self, rows):
+        """
+        Take requests that are about to be reassigned out of their technicians'
+        load, but keep their slots blocked until assign() places them again.
+        """
+        for bookings in self.bookings.values():
+            bookings.hours = 0.0
+        self._heaps = {}
+        self._load_bookings(set(self.bookings), {row.id for row in rows})
+        self._holders = {}
+        for row in rows:
+            if row.assigned_technician_id in self.bookings and row.scheduled_date is not None:
+                self.bookings[row.assigned_technician_id].hold(
+                    row.id, row.scheduled_date, row.scheduled_date + timedelta(hours=job_hours(row.duration_hours)))
+                self._holders[row.id] = row.assigned_technician_id
+
+    def _heap(self, team_id):
+        if team_id not in self._heaps:
+            heap = [(self.bookings[technician_id].hours, position, technician_id)
+                    for position, technician_id in enumerate(self.members.get(team_id, []))]
+            heapq.heapify(heap)
+            self._heaps[team_id] = heap
+        return self._heaps[team_id]
+
+    def assign(self, team_id, scheduled_date, duration_hours, request_id=None):
+        """
+        Book the least-loaded team member who is free at scheduled_date and
+        return their technician id, or None if nobody in the team is free.
+        A held request's own slot doesn't count as busy, and is released
+        once the request is booked; if nobody is free, it stays held.
+        """
+        hours = job_hours(duration_hours)
+        start = scheduled_date
+        end = start + timedelta(hours=hours) if start else None
+        heap = self._heap(team_id)
+        busy = []
+        chosen = None
+        while heap:
+            load, position, technician_id = heapq.heappop(heap)
+            if load != self.bookings[technician_id].hours:
+                continue  # Stale entry: the technician was booked through another team
+            if start is None or self.bookings[technician_id].is_free(start, end, ignore=request_id):
+                chosen = technician_id
+                break
+            busy.append((load, position, technician_id))
+        for entry in busy:
+            heapq.heappush(heap, entry)
+        if chosen is None:
+            return None
+        if request_id in self._holders:
+            self.bookings[self._holders.pop(request_id)].unhold(request_id)
+
+        bookings = self.bookings[chosen]
+        if start is not None:
+            bookings.book(start, end)
+        bookings.hours += hours
+        # Re-queue the technician with the new load in every team heap; older entries go stale
+        for other_team, technician_ids in self.members.items():
+            if chosen in technician_ids and other_team in self._heaps:
+                heapq.heappush(self._heaps[other_team],
+                               (bookings.hours, technician_ids.index(chosen), chosen))
+        return chosen
+
+
+def auto_assign(request_obj):
+    """Pick a Technician for one new request, or None when its team has nobody free"""
+    if not request_obj.maintenance_team_id:
+        return None
+    # Load is compared over the week starting on the request's day (today when unscheduled)
+    day = datetime.combine((request_obj.scheduled_date or datetime.utcnow()).date(), datetime.min.time())
+    planner = AssignmentPlanner(day, day + PLANNING_WINDOW, team_ids=[int(request_obj.maintenance_team_id)])
+    technician_id = planner.assign(int(request_obj.maintenance_team_id), request_obj.scheduled_date,
+                                   request_obj.duration_hours)
+    return db.session.get(Technician, technician_id) if technician_id else None
+
+
+def rebalance(window_start, window_end):
+    """
+    Reassign every New request scheduled in the window, longest jobs of each
+    slot first. In-progress work stays where it is, and a request nobody is
+    free for keeps its current technician. Returns (assigned, unplaced).
+    """
+    rows = db.session.execute(
+        select(MaintenanceRequest.id, MaintenanceRequest.maintenance_team_id,
+               MaintenanceRequest.assigned_technician_id,
+               MaintenanceRequest.scheduled_date, MaintenanceRequest.duration_hours)
+        .where(MaintenanceRequest.stage == 'New',
+               MaintenanceRequest.scheduled_date >= window_start,
+               MaintenanceRequest.scheduled_date < window_end)).all()
+    planner = AssignmentPlanner(window_start, window_end)
+    planner.hold(rows)
+
+    updates = []
+    unplaced = 0
+    for row in sorted(rows, key=lambda row: (row.scheduled_date, -job_hours(row.duration_hours))):
+        technician_id = planner.assign(row.maintenance_team_id, row.scheduled_date, row.duration_hours, row.id)
+        if technician_id is None:
+            unplaced += 1
+        elif technician_id != row.assigned_technician_id:
+            updates.append({'request_id': row.id, 'technician_id': technician_id,
+                            'technician': planner.names[technician_id]})
+    if updates:
+        table = MaintenanceRequest.__table__
+        with audited_bulk_update(MaintenanceRequest, [update['request_id'] for update in updates]):
+            db.session.execute(table.update()
+                               .where(table.c.id == bindparam('request_id'))
+                               .values(assigned_technician_id=bindparam('technician_id'),
+                                       assigned_technician=bindparam('technician')), updates)
+    return len(rows) - unplaced, unplaced
+
+
+def overlapping_bookings(window_start, window_end):
+    """
+    (technician id, request id, request id) for every pair of consecutive open
+    requests of one technician whose slots overlap within the window
+    """
+    rows = db.session.execute(
+        select(MaintenanceRequest.id, MaintenanceRequest.assigned_technician_id,
+               MaintenanceRequest.scheduled_date, MaintenanceRequest.duration_hours)
+        .where(MaintenanceRequest.assigned_technician_id.isnot(None),
+               MaintenanceRequest.stage.in_(OPEN_STAGES),
+               MaintenanceRequest.scheduled_date >= window_start - BOOKING_LOOKBACK,
+               MaintenanceRequest.scheduled_date < window_end)
+        .order_by(MaintenanceRequest.assigned_technician_id, MaintenanceRequest.scheduled_date)).all()
+    overlaps = []
+    previous = None
+    busy_until = None
+    for row in rows:
+        end = row.scheduled_date + timedelta(hours=job_hours(row.duration_hours))
+        if previous is not None and previous.assigned_technician_id == row.assigned_technician_id:
+            if row.scheduled_date < busy_until:
+                overlaps.append((row.assigned_technician_id, previous.id, row.id))
+            if end <= busy_until:
+                continue  # Keep comparing against the job that ends last
+        previous, busy_until = row, end
+    return overlaps
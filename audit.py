@@ -0,0 +1,213 @@
+"""
+Append-only history of requests and equipment.
+
+Every flush that creates, changes or deletes a MaintenanceRequest or an
+Equipment row appends an AuditEvent with the changed fields' old and new
+values and the logged-in user, in the same transaction, so history can't
+diverge from the data. Set-based statements bypass the flush: bulk inserts
+(imports, generated preventive requests) go through audited_insert(),
+which records a create per inserted row, and the routes and jobs that run
+set-based UPDATEs wrap them in audited_bulk_update(), which compares the
+rows before and after.
+
+Events are never updated: SQLite triggers reject any UPDATE of either
+audit table, and the only DELETE is archive_events() moving events older
+than a cutoff into audit_events_archive in id order. Ids are
+AUTOINCREMENT, so every archived event is older than every live one. A
+timeline reads the live table's (entity_type, entity_id, id) index and
+only continues into the archive once the live events are exhausted.
+"""
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from flask import has_request_context, session as http_session
+from sqlalchemy import event, inspect, select, delete
+from sqlalchemy.orm import Session
+from models import db, MaintenanceRequest, Equipment, AuditEvent, ArchivedAuditEvent
+
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = 10000
+IN_CHUNK = 500
+
+# Derived or bookkeeping columns that would only add noise to a timeline
+UNAUDITED_COLUMNS = {'id', 'created_at', 'updated_at', 'completed_at', 'change_seq', 'row_version',
+                     'open_request_count', 'new_request_count', 'in_progress_request_count',
+                     'last_maintenance_date'}
+
+# model -> entity_type
+AUDITED_MODELS = {MaintenanceRequest: 'request', Equipment: 'equipment'}
+
+
+def _audited_columns(model):
+    return [column.key for column in model.__table__.columns if column.key not in UNAUDITED_COLUMNS]
+
+
+AUDITED_COLUMNS = {model: _audited_columns(model) for model in AUDITED_MODELS}
+
+
+def install_audit_guards(conn):
+    """Make both audit tables reject updates, and the archive reject deletes"""
+    for table in ('audit_events', 'audit_events_archive'):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_no_update BEFORE UPDATE ON {table} "
+            f"BEGIN SELECT RAISE(ABORT, '{table} is append-only'); END")
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS audit_events_archive_no_delete BEFORE DELETE ON audit_events_archive "
+        "BEGIN SELECT RAISE(ABORT, 'audit_events_archive is append-only'); END")
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _actor():
+    if has_request_context():
+        return http_session.get('user_id'), http_session.get('username')
+    return None, None
+
+
+def _event_row(entity_type, entity_id, action, changes, actor, now):
+    user_id, username = actor
+    return {'entity_type': entity_type, 'entity_id': entity_id, 'action': action, 'changes': changes,
+            'user_id': user_id, 'username': username, 'created_at': now}
+
+
+def record_events(connection, rows):
+    if rows:
+        connection.execute(AuditEvent.__table__.insert(), rows)
+
+
+def _created_changes(model, values):
+    return {key: [None, _json_value(values[key])] for key in AUDITED_COLUMNS[model] if values.get(key) is not None}
+
+
+def _instance_changes(instance, action):
+    state = inspect(instance)
+    # Loaded values only: loading an attribute of a just-deleted row in the middle of a flush would fail
+    values = state.dict
+    changes = {}
+    for key in AUDITED_COLUMNS[type(instance)]:
+        history = state.attrs[key].history
+        if action == 'create':
+            old, new = None, values.get(key)
+        elif action == 'delete':
+            old, new = values.get(key), None
+        elif history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+        else:
+            continue
+        # A blank form field stores '' where the row had NULL; neither is a change
+        if old != new and not (old in (None, '') and new in (None, '')):
+            changes[key] = [_json_value(old), _json_value(new)]
+    return changes
+
+
+@event.listens_for(Session, 'after_flush')
+def _audit_flush(session, flush_context):
+    rows = []
+    actor, now = _actor(), datetime.utcnow()
+    for instances, action in ((session.new, 'create'), (session.dirty, 'update'), (session.deleted, 'delete')):
+        for instance in instances:
+            entity_type = AUDITED_MODELS.get(type(instance))
+            if entity_type is None:
+                continue
+            changes = _instance_changes(instance, action)
+            if changes or action != 'update':
+                rows.append(_event_row(entity_type, instance.id, action, changes, actor, now))
+    # Core insert on the flush's own connection: same transaction, and nothing new for the ORM to flush
+    record_events(session.connection(), rows)
+
+
+def audited_insert(model, rows):
+    """
+    Insert `rows` (dicts of column values) with one executemany and, for an
+    audited model, record a create event for each
+    """
+    table = model.__table__
+    entity_type = AUDITED_MODELS.get(model)
+    if not rows:
+        return
+    if entity_type is None:
+        db.session.execute(table.insert(), rows)
+        return
+    # The stored values come back with each id, so events don't depend on the order rows are returned in
+    columns = [table.c[key] for key in AUDITED_COLUMNS[model]]
+    inserted = db.session.execute(table.insert().returning(table.c.id, *columns), rows)
+    actor, now = _actor(), datetime.utcnow()
+    record_events(db.session, [_event_row(entity_type, row.id, 'create', _created_changes(model, row._mapping), actor, now)
+                               for row in inserted])
+
+
+def _snapshot(model, ids):
+    columns = [model.__table__.c[key] for key in AUDITED_COLUMNS[model]]
+    snapshot = {}
+    for index in range(0, len(ids), IN_CHUNK):
+        for row in db.session.execute(select(model.id, *columns).where(model.id.in_(ids[index:index + IN_CHUNK]))):
+            snapshot[row.id] = row._mapping
+    return snapshot
+
+
+@contextmanager
+def audited_bulk_update(model, ids):
+    """Record what the set-based UPDATEs run inside the block change in the rows with `ids`"""
+    ids = sorted({id for id in ids if id is not None})
+    before = _snapshot(model, ids) if ids else {}
+    yield
+    if not before:
+        return
+    after = _snapshot(model, list(before))
+    actor, now = _actor(), datetime.utcnow()
+    rows = []
+    for id, old_row in before.items():
+        new_row = after.get(id)
+        if new_row is None:
+            continue
+        changes = {key: [_json_value(old_row[key]), _json_value(new_row[key])]
+                   for key in AUDITED_COLUMNS[model] if old_row[key] != new_row[key]}
+        if changes:
+            rows.append(_event_row(AUDITED_MODELS[model], id, 'update', changes, actor, now))
+    record_events(db.session, rows)
+
+
+def timeline(entity_type, entity_id, before_id=None, limit=50):
+    """
+    The entity's newest `limit` events older than event `before_id`, newest
+    first, and the id to continue from (None when there are no more).
+    """
+    events = []
+    for model in (AuditEvent, ArchivedAuditEvent):
+        query = model.query.filter(model.entity_type == entity_type, model.entity_id == entity_id)
+        if before_id is not None:
+            query = query.filter(model.id < before_id)
+        events.extend(query.order_by(model.id.desc()).limit(limit + 1 - len(events)).all())
+        if len(events) > limit:
+            break
+    if len(events) > limit:
+        return events[:limit], events[limit - 1].id
+    return events, None
+
+
+def archive_events(older_than_days):
+    """Move events older than `older_than_days` days to the archive; returns how many moved"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    # Ids follow time, so archiving everything up to the newest old event keeps the archive strictly older
+    boundary = db.session.scalar(select(db.func.max(AuditEvent.id)).where(AuditEvent.created_at < cutoff))
+    if boundary is None:
+        return 0
+    live, archive = AuditEvent.__table__, ArchivedAuditEvent.__table__
+    moved = 0
+    while True:
+        ids = db.session.scalars(select(live.c.id).where(live.c.id <= boundary)
+                                 .order_by(live.c.id).limit(ARCHIVE_BATCH_SIZE)).all()
+        if not ids:
+            break
+        batch = live.c.id.between(ids[0], ids[-1])
+        db.session.execute(archive.insert().from_select(
+            [column.key for column in live.columns], select(*live.columns).where(batch)))
+        db.session.execute(delete(live).where(batch))
+        db.session.commit()
+        moved += len(ids)
+    return moved
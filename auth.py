@@ -0,0 +1,73 @@
+"""
+Session authentication: the per-request current user and login_required.
+
+The logged-in user is loaded at most once per request and kept on
+flask.g. User rows can additionally be served from a short-TTL in-process
+cache (USER_CACHE_TTL seconds; off by default). It is invalidated only
+when this process updates or deletes a user through the ORM: a bulk
+UPDATE, or a change made by another worker, is served stale (including
+a removed user or an old role) until the entry expires. Enable it only
+where that delay is acceptable.
+"""
+import os
+from functools import wraps
+from flask import g, session, flash, redirect, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from cache import TTLCache
+from models import db, User
+
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '0'))
+
+_user_cache = TTLCache(maxsize=int(os.getenv('USER_CACHE_SIZE', '1024')), ttl=USER_CACHE_TTL)
+
+
+def _detached_copy(user):
+    """Copy a user's column values into a detached instance that is safe to share"""
+    copy = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def get_user(user_id):
+    """Load a user by id, from the in-process cache when enabled"""
+    if USER_CACHE_TTL > 0:
+        cached = _user_cache.get(user_id)
+        if cached is not None:
+            # Attach a copy to this request's session without issuing a SELECT
+            return db.session.merge(cached, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None and USER_CACHE_TTL > 0:
+        _user_cache.set(user_id, _detached_copy(user))
+    return user
+
+
+def invalidate_user(user_id):
+    _user_cache.delete(user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+def load_current_user():
+    """Return the logged-in User (or None), loading it at most once per request"""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = get_user(user_id) if user_id else None
+    return g.current_user
+
+
+# Login required decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if load_current_user() is None:
+            # Also drops sessions that point at a deleted user
+            session.clear()
+            flash('Please log in to access this page.', 'error')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,97 @@
+"""
+Concurrent write benchmark for the SQLite settings in database.py.
+
+Runs the same workload twice against fresh temporary databases: once with
+SQLite/pysqlite defaults (rollback journal, synchronous=FULL, implicit
+deferred transactions) and once with the tuned settings (WAL,
+synchronous=NORMAL, busy timeout, BEGIN IMMEDIATE for writers). Each
+worker thread repeats what update_request_stage() does: read a request,
+then update its stage and commit.
+
+    python bench_sqlite.py --threads 8 --transactions 300
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import OperationalError
+from database import configure_sqlite_engine, engine_options, sqlite_settings
+from models import db, MaintenanceRequest, REQUEST_STAGES
+
+
+def build_engine(path, tuned):
+    url = f'sqlite:///{path}'
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    # No Flask request here to tell reads from writes, so every transaction is a writer
+    configure_sqlite_engine(engine, dict(sqlite_settings(), begin='immediate'))
+    return engine
+
+
+def prepare(engine, rows):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(MaintenanceRequest), [
+            {'subject': f'Request {i}', 'request_type': 'Corrective', 'stage': 'New'} for i in range(rows)
+        ])
+
+
+def worker(engine, transactions, rows, seed, stats, lock):
+    rng = random.Random(seed)
+    done = errors = 0
+    for _ in range(transactions):
+        request_id = rng.randint(1, rows)
+        try:
+            with engine.begin() as conn:
+                conn.execute(select(MaintenanceRequest.stage).where(MaintenanceRequest.id == request_id)).scalar()
+                conn.execute(update(MaintenanceRequest)
+                             .where(MaintenanceRequest.id == request_id)
+                             .values(stage=rng.choice(REQUEST_STAGES)))
+            done += 1
+        except OperationalError:
+            # "database is locked"
+            errors += 1
+    with lock:
+        stats['committed'] += done
+        stats['errors'] += errors
+
+
+def run(tuned, args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite3')
+        engine = build_engine(path, tuned)
+        prepare(engine, args.rows)
+        stats = {'committed': 0, 'errors': 0}
+        lock = threading.Lock()
+        threads = [threading.Thread(target=worker, args=(engine, args.transactions, args.rows, i, stats, lock))
+                   for i in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+    return stats['committed'] / elapsed, stats['errors'], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare SQLite concurrent write throughput')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--transactions', type=int, default=200, help='Transactions per thread')
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.transactions} read-then-update transactions")
+    print(f"{'settings':10} {'commits/s':>10} {'locked errors':>14} {'seconds':>8}")
+    for label, tuned in (('default', False), ('tuned', True)):
+        throughput, errors, elapsed = run(tuned, args)
+        print(f"{label:10} {throughput:10.1f} {errors:14d} {elapsed:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
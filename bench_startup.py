@@ -0,0 +1,60 @@
+"""
+Startup time benchmark.
+
+Measures how long a fresh interpreter takes to import the app (what every
+gunicorn worker boot and every seed/datagen run pays) for each
+AUTH_PROVIDER, and, for comparison, how long importing the Firebase Admin
+SDK's auth module takes on its own; that import used to be part of every
+startup. Each run is a separate process against a scratch SQLite database
+that is migrated once beforehand.
+
+    python bench_startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from firebase_auth_service import AUTH_PROVIDERS
+
+TIMED_IMPORT = ('import time; started = time.perf_counter(); {statement}; '
+                'print(time.perf_counter() - started)')
+
+
+def time_import(statement, env, runs):
+    """Seconds each of `runs` fresh interpreters took to execute `statement`"""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', TIMED_IMPORT.format(statement=statement)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def report(label, timings):
+    print(f'{label:<28} median {statistics.median(timings) * 1000:7.1f} ms   '
+          f'min {min(timings) * 1000:7.1f} ms   max {max(timings) * 1000:7.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'startup.sqlite3')}")
+        # Create the schema and apply migrations so the timed runs only start up
+        subprocess.run([sys.executable, '-c', 'import app'], env=env, capture_output=True, check=True)
+
+        for provider in AUTH_PROVIDERS:
+            report(f'import app ({provider})', time_import('import app', dict(env, AUTH_PROVIDER=provider), args.runs))
+        try:
+            report('import firebase_admin.auth', time_import('import firebase_admin.auth', env, args.runs))
+        except subprocess.CalledProcessError:
+            print('firebase_admin is not installed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Route benchmark suite.
+
+Drives the Flask test client against the main read and write routes and
+reports p50/p95/p99 latency, SQL queries per request and throughput for
+each. Run it against a database filled by datagen.py, never against real
+data, because the write scenarios create and modify requests:
+
+    DATABASE_URL=sqlite:////tmp/gearguard-load.sqlite3 python benchmark.py --iterations 200
+
+Use --save to record a baseline and --baseline to fail (exit status 1) when
+a later run regresses past --tolerance.
+
+Routes served from the fragment cache are measured twice: once with every
+tracked table's version bumped before each request, so each one renders
+from the database like the first poll after a write, and once more as
+"(cached)". The query-count gate is only meaningful for the first.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import date
+from sqlalchemy import event, select, func
+from app import app, calendar_range
+from models import db, User, Equipment, MaintenanceRequest, REQUEST_STAGES
+import fragments
+
+
+class QueryCounter:
+    """Counts SQL statements executed on the engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def build_scenarios(rng):
+    """Map scenario name to a function returning (method, url, form data)"""
+    equipment_ids = list(db.session.scalars(select(Equipment.id).order_by(func.random()).limit(1000)))
+    request_ids = list(db.session.scalars(select(MaintenanceRequest.id).order_by(func.random()).limit(1000)))
+    if not equipment_ids or not request_ids:
+        raise SystemExit('The database has no equipment or requests - run datagen.py first')
+    month, next_month = calendar_range('month', date.today())
+
+    return {
+        'GET /dashboard': lambda: ('GET', '/dashboard', None),
+        'GET /requests': lambda: ('GET', '/requests', None),
+        'GET /requests?stage': lambda: ('GET', f'/requests?stage={rng.choice(REQUEST_STAGES)}', None),
+        'GET /calendar/events': lambda: ('GET', f'/calendar/events?start={month}&end={next_month}', None),
+        'GET /equipment': lambda: ('GET', '/equipment', None),
+        'GET /equipment/<id>': lambda: ('GET', f'/equipment/{rng.choice(equipment_ids)}', None),
+        'POST /request/new': lambda: ('POST', '/request/new', {
+            'subject': 'Benchmark request',
+            'request_type': 'Corrective',
+            'request_for': 'equipment',
+            'equipment_id': str(rng.choice(equipment_ids)),
+        }),
+        'POST /request/<id>/update_stage': lambda: (
+            'POST', f'/request/{rng.choice(request_ids)}/update_stage',
+            {'stage': rng.choice(['New', 'In Progress', 'Repaired'])}),
+    }
+
+
+# Scenarios whose response comes from fragments.cached_fragment
+FRAGMENT_SCENARIOS = {'GET /dashboard', 'GET /calendar/events'}
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        user = User.query.order_by(User.id).first()
+        if not user:
+            raise SystemExit('The database has no users - run datagen.py first')
+        scenarios = build_scenarios(rng)
+        counter = QueryCounter(db.engine)
+    # (name, request factory, whether to invalidate the fragment cache before each request)
+    runs = []
+    for name, make_request in scenarios.items():
+        runs.append((name, make_request, name in FRAGMENT_SCENARIOS))
+        if name in FRAGMENT_SCENARIOS and fragments.store is not None:
+            runs.append((f'{name} (cached)', make_request, False))
+    if args.only:
+        runs = [entry for entry in runs if args.only in entry[0]]
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['username'] = user.username
+        sess['role'] = user.role
+
+    for name, make_request, uncached in runs:
+        for _ in range(args.warmup):
+            method, url, data = make_request()
+            client.open(url, method=method, data=data)
+
+        timings = []
+        queries = 0
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            method, url, data = make_request()
+            if uncached:
+                with app.app_context():
+                    fragments.invalidate_tables(fragments.TRACKED_TABLES)
+            before = counter.count
+            request_started = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            response.get_data()
+            timings.append((time.perf_counter() - request_started) * 1000)
+            queries += counter.count - before
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+        timings.sort()
+        results[name] = {
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+            'queries_per_request': queries / args.iterations,
+            'requests_per_second': args.iterations / elapsed,
+            'errors': errors,
+        }
+    return results
+
+
+def print_report(results):
+    print(f"{'scenario':34} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'req/s':>9} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:34} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r['queries_per_request']:8.1f} {r['requests_per_second']:9.1f} {r['errors']:7d}")
+
+
+def regressions(results, baseline, tolerance):
+    """Scenarios whose p95 or query count got worse than the baseline allows"""
+    problems = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {r['p95_ms']:.2f}ms vs baseline {base['p95_ms']:.2f}ms")
+        if r['queries_per_request'] > base['queries_per_request'] + 0.5:
+            problems.append(f"{name}: {r['queries_per_request']:.1f} queries/request "
+                            f"vs baseline {base['queries_per_request']:.1f}")
+        if r['errors'] > base['errors']:
+            problems.append(f"{name}: {r['errors']} errors vs baseline {base['errors']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main GearGuard routes')
+    parser.add_argument('--iterations', type=int, default=100, help='Measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', help='Run only scenarios whose name contains this text')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown vs baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Check that the queries issued by the main routes are served by an index.
+
+Drives the routes through the Flask test client, captures every SELECT
+they run and asserts that EXPLAIN QUERY PLAN never falls back to a full
+scan of a watched table. Run against a seeded database:
+
+    python check_query_plans.py
+"""
+import sys
+from sqlalchemy import event
+from app import app
+from models import db, User, Equipment, Technician
+
+# Tables that grow with the fleet and must never be scanned by a route
+WATCHED_TABLES = ['maintenance_requests', 'equipment']
+
+
+def route_urls():
+    """URLs to check, filled in with ids from the current database"""
+    equipment = Equipment.query.first()
+    technician = Technician.query.first()
+    urls = [
+        '/dashboard',
+        '/dashboard/column?stage=New&before=1000000',
+        '/requests',
+        '/requests?stage=New',
+        '/equipment',
+        '/equipment?category=IT',
+        '/calendar/events?start=2025-01-01&end=2025-02-01',
+    ]
+    if equipment:
+        urls += [
+            f'/equipment/{equipment.id}',
+            f'/equipment/{equipment.id}/maintenance_requests',
+        ]
+    if technician:
+        urls.append(f'/technician/{technician.id}')
+    return urls
+
+
+def capture_selects(client, url):
+    """Run one request and return the (sql, params) of every SELECT it issued"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} returned {response.status_code}')
+    return statements
+
+
+def full_scans(statement, parameters):
+    """Return the query plan lines that scan a watched table without an index"""
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    details = [row[-1] for row in plan]
+    # A rowid-order scan that stops at LIMIT (no sort step) only reads one page
+    ordered_page = 'LIMIT' in statement.upper() and not any('TEMP B-TREE' in d for d in details)
+    problems = []
+    for detail in details:
+        for table in WATCHED_TABLES:
+            if detail == f'SCAN {table}' and ordered_page:
+                continue
+            if detail.startswith(f'SCAN {table}') and 'INDEX' not in detail:
+                problems.append(detail)
+    return problems
+
+
+def main():
+    failures = 0
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            print('EXPLAIN QUERY PLAN checks only run against SQLite')
+            return 0
+        user = User.query.first()
+        if not user:
+            print('No users found - run seed.py first')
+            return 1
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['username'] = user.username
+            sess['role'] = user.role
+
+        for url in route_urls():
+            for statement, parameters in capture_selects(client, url):
+                problems = full_scans(statement, parameters)
+                if problems:
+                    failures += 1
+                    print(f'FAIL {url}: {"; ".join(problems)}')
+                    print(f'     {" ".join(statement.split())[:200]}')
+            print(f'checked {url}')
+
+    if failures:
+        print(f'{failures} queries are not using an index')
+        return 1
+    print('All route queries use an index')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
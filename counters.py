@@ -0,0 +1,55 @@
+"""
+Denormalized per-equipment request counters.
+
+Equipment carries open/new/in-progress request counts and the date of the
+last completed maintenance so list pages never touch maintenance_requests.
+Routes that write requests call refresh_equipment_counters() for the
+equipment they touched before committing, so the counters change in the
+same transaction as the requests. Each refresh recomputes the counters of
+those rows from the (equipment_id, stage) index rather than applying deltas,
+so it can't drift.
+"""
+from sqlalchemy import select, update, func
+from models import db, Equipment, MaintenanceRequest
+
+
+def equipment_counters_update(equipment_ids=None):
+    """UPDATE statement recomputing counters for the given equipment ids (all when None)"""
+    def count(*stages):
+        return select(func.count(MaintenanceRequest.id)).where(
+            MaintenanceRequest.equipment_id == Equipment.id,
+            MaintenanceRequest.stage.in_(stages)
+        ).scalar_subquery()
+
+    # When the repair was finished; requests closed before completed_at existed fall back to their planned date
+    last_maintenance = select(
+        func.max(func.coalesce(MaintenanceRequest.completed_at, MaintenanceRequest.scheduled_date,
+                               MaintenanceRequest.created_at))
+    ).where(
+        MaintenanceRequest.equipment_id == Equipment.id,
+        MaintenanceRequest.stage == 'Repaired'
+    ).scalar_subquery()
+
+    stmt = update(Equipment).values(
+        new_request_count=count('New'),
+        in_progress_request_count=count('In Progress'),
+        open_request_count=count('New', 'In Progress'),
+        last_maintenance_date=last_maintenance
+    )
+    if equipment_ids is not None:
+        stmt = stmt.where(Equipment.id.in_(equipment_ids))
+    return stmt
+
+
+def refresh_equipment_counters(equipment_ids=None):
+    """
+    Recompute counters inside the current session transaction.
+    Pass the ids of every piece of equipment whose requests changed
+    (including the old equipment when a request was moved); None means all.
+    """
+    if equipment_ids is not None:
+        equipment_ids = {int(equipment_id) for equipment_id in equipment_ids if equipment_id}
+        if not equipment_ids:
+            return
+    db.session.execute(equipment_counters_update(equipment_ids),
+                       execution_options={'synchronize_session': False})
@@ -0,0 +1,108 @@
+"""
+Database engine configuration.
+
+The database is chosen with DATABASE_URL (SQLite by default, PostgreSQL
+or any other SQLAlchemy URL in production). Everything else is tuned
+through environment variables:
+
+SQLite (applied to every new connection through an engine connect event):
+  SQLITE_JOURNAL_MODE     journal mode, WAL lets readers run alongside a writer (default WAL)
+  SQLITE_SYNCHRONOUS      NORMAL is durable in WAL mode and avoids an fsync per commit (default NORMAL)
+  SQLITE_CACHE_SIZE       page cache, negative values are KiB (default -65536, i.e. 64 MiB)
+  SQLITE_MMAP_SIZE        bytes of the file to memory-map (default 268435456)
+  SQLITE_BUSY_TIMEOUT_MS  how long to wait for a lock before "database is locked" (default 5000)
+  SQLITE_BEGIN            transaction begin mode: deferred, immediate or auto (default auto).
+                          auto takes the write lock up front (BEGIN IMMEDIATE) for requests
+                          that can write (anything but GET/HEAD/OPTIONS), so a writer never
+                          fails trying to upgrade a read lock, and reads stay deferred.
+
+Connection pool (all databases):
+  DB_POOL_SIZE (default 10), DB_MAX_OVERFLOW (default 20), DB_POOL_TIMEOUT seconds (default 30)
+Server databases only:
+  DB_POOL_RECYCLE seconds (default 1800), DB_POOL_PRE_PING (default true)
+"""
+import os
+from flask import has_request_context, request
+from sqlalchemy import event
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def database_url():
+    return os.getenv('DATABASE_URL', 'sqlite:///db.sqlite3')
+
+
+def _flag(name, default):
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def sqlite_settings():
+    return {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', '268435456')),
+        'busy_timeout_ms': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'begin': os.getenv('SQLITE_BEGIN', 'auto').lower(),
+    }
+
+
+def engine_options(url):
+    """Keyword arguments for create_engine (SQLALCHEMY_ENGINE_OPTIONS)"""
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+    }
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url.rstrip('/') in ('sqlite:', 'sqlite:/'):
+            # In-memory databases live in a single connection, pool settings don't apply
+            return {}
+        # Connections are handed between request threads by the pool
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        options['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+        options['pool_pre_ping'] = _flag('DB_POOL_PRE_PING', 'true')
+    return options
+
+
+def _begin_mode(mode):
+    if mode == 'auto':
+        if has_request_context() and request.method not in READ_ONLY_METHODS:
+            return 'IMMEDIATE'
+        return 'DEFERRED'
+    return mode.upper()
+
+
+def configure_sqlite_engine(engine, settings=None):
+    """Apply pragmas and explicit transaction control to a SQLite engine"""
+    settings = settings or sqlite_settings()
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see begin below) instead of pysqlite
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+        cursor.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        cursor.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(conn):
+        conn.exec_driver_sql(f"BEGIN {_begin_mode(settings['begin'])}")
+
+
+def configure_database(app):
+    """Set the database URL and engine options on the Flask app config"""
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+
+
+def configure_engine(engine):
+    """Engine-level setup that has to happen before the first connection"""
+    if engine.dialect.name == 'sqlite':
+        configure_sqlite_engine(engine)
@@ -0,0 +1,192 @@
+"""
+Synthetic data generator for load testing.
+
+Fills the configured database (DATABASE_URL, default instance/db.sqlite3)
+with realistic volumes of users, teams, work centers, equipment and
+maintenance requests using bulk inserts. Use a separate database:
+
+    DATABASE_URL=sqlite:////tmp/gearguard-load.sqlite3 python datagen.py --reset --equipment 50000 --requests 500000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import app
+from models import db, User, Equipment, MaintenanceTeam, MaintenanceRequest, WorkCenter, CLOSED_STAGES
+from counters import refresh_equipment_counters
+from technicians import link_technicians
+from migrations import run_migrations
+
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ['James', 'Maria', 'Robert', 'Linda', 'Ahmed', 'Priya', 'Wei', 'Sofia', 'Carlos', 'Aisha',
+               'John', 'Emma', 'Kenji', 'Olga', 'Daniel', 'Fatima', 'Lucas', 'Chloe', 'Ivan', 'Grace']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kowalski', 'Okafor', 'Nguyen', 'Muller', 'Rossi', 'Silva',
+              'Johnson', 'Kim', 'Haddad', 'Novak', 'Brown', 'Sato', 'Ivanova', 'Lopez', 'Khan', 'Taylor']
+
+CATEGORIES = {'Mechanical': 5, 'Electrical': 3, 'IT': 2}
+DEPARTMENTS = {'Production': 6, 'Admin': 2, 'IT': 2}
+WORKCENTER_DEPARTMENTS = {'Production': 7, 'Quality': 2, 'Logistics': 1}
+# Most history is closed work; a minority is still open on the board
+STAGES = {'New': 12, 'In Progress': 8, 'Repaired': 75, 'Scrap': 5}
+EQUIPMENT_KINDS = ['Conveyor', 'Press', 'Pump', 'Compressor', 'Robot Arm', 'CNC Mill', 'Lathe', 'Boiler',
+                   'Chiller', 'Generator', 'UPS', 'Server', 'Network Switch', 'Forklift', 'Mixer']
+SUBJECTS = ['Inspect {}', 'Lubricate {}', 'Replace belt on {}', 'Calibrate {}', 'Repair leak on {}',
+            'Replace filter on {}', 'Firmware update for {}', 'Noise from {}', '{} overheating',
+            'Quarterly service of {}']
+
+
+def weighted(choices, rng, k):
+    return rng.choices(list(choices), weights=list(choices.values()), k=k)
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def bulk_insert(model, rows):
+    """Insert rows in batches, committing after each one"""
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+        db.session.commit()
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+
+    # Hashing is deliberately slow, so every generated user shares one password
+    password_hash = generate_password_hash('Password1!')
+    bulk_insert(User, [{
+        'username': f'user{i}',
+        'email': f'user{i}@gearguard.example',
+        'password_hash': password_hash,
+        'role': 'admin' if i == 0 else rng.choice(['manager', 'user', 'user', 'user']),
+    } for i in range(args.users)])
+
+    team_members = []
+    team_rows = []
+    for i in range(args.teams):
+        members = sorted({person_name(rng) for _ in range(args.technicians_per_team)})
+        team_members.append(members)
+        team_rows.append({'name': f'{rng.choice(list(CATEGORIES))} Team {i + 1}', 'members': ', '.join(members)})
+    bulk_insert(MaintenanceTeam, team_rows)
+    team_ids = list(db.session.scalars(select(MaintenanceTeam.id).order_by(MaintenanceTeam.id)))[-args.teams:]
+    members_by_team = dict(zip(team_ids, team_members))
+
+    bulk_insert(WorkCenter, [{
+        'name': f'Work Center {i + 1}',
+        'code': f'WC{args.seed}-{i + 1:05d}',
+        'location': f'Building {chr(65 + i % 6)}',
+        'department': weighted(WORKCENTER_DEPARTMENTS, rng, 1)[0],
+        'responsible_person': person_name(rng),
+        'status': 'Active' if rng.random() < 0.95 else 'Inactive',
+    } for i in range(args.workcenters)])
+
+    equipment_rows = []
+    for i, category in enumerate(weighted(CATEGORIES, rng, args.equipment)):
+        team_id = rng.choice(team_ids)
+        purchased = now - timedelta(days=rng.randint(30, 3650))
+        equipment_rows.append({
+            'name': f'{rng.choice(EQUIPMENT_KINDS)} {i + 1}',
+            'serial_number': f'SN{args.seed}-{i + 1:08d}',
+            'category': category,
+            'department': weighted(DEPARTMENTS, rng, 1)[0],
+            'assigned_employee': person_name(rng),
+            'maintenance_team_id': team_id,
+            'default_technician': rng.choice(members_by_team[team_id]),
+            'purchase_date': purchased.date(),
+            'warranty_end': (purchased + timedelta(days=rng.choice([365, 730, 1095]))).date(),
+            'location': f'Floor {rng.randint(1, 5)}',
+            'status': 'Active' if rng.random() < 0.97 else 'Scrapped',
+        })
+    bulk_insert(Equipment, equipment_rows)
+    del equipment_rows
+
+    equipment = db.session.execute(
+        select(Equipment.id, Equipment.name, Equipment.category, Equipment.maintenance_team_id)
+        .order_by(Equipment.id)).all()[-args.equipment:]
+    workcenters = db.session.execute(
+        select(WorkCenter.id, WorkCenter.name, WorkCenter.department)
+        .order_by(WorkCenter.id)).all()[-args.workcenters:]
+
+    # Request volume per asset is heavily skewed: a few machines break all the time
+    cum_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(equipment))))
+    rng.shuffle(equipment)
+
+    rows = []
+    for _ in range(args.requests):
+        created = now - timedelta(seconds=rng.randint(0, args.days * 86400))
+        preventive = rng.random() < 0.4
+        row = {
+            'request_type': 'Preventive' if preventive else 'Corrective',
+            'stage': weighted(STAGES, rng, 1)[0],
+            'created_at': created,
+            'scheduled_date': created + timedelta(days=rng.randint(1, 30), hours=rng.randint(6, 18))
+            if preventive or rng.random() < 0.3 else None,
+            'duration_hours': round(rng.lognormvariate(0.7, 0.6), 1),
+            'equipment_id': None,
+            'workcenter_id': None,
+        }
+        if workcenters and rng.random() < 0.1:
+            workcenter = rng.choice(workcenters)
+            row.update(subject=rng.choice(SUBJECTS).format(workcenter.name),
+                       workcenter_id=workcenter.id,
+                       category=workcenter.department,
+                       maintenance_team_id=None,
+                       assigned_technician=None)
+        else:
+            equip = rng.choices(equipment, cum_weights=cum_weights)[0]
+            row.update(subject=rng.choice(SUBJECTS).format(equip.name),
+                       equipment_id=equip.id,
+                       category=equip.category,
+                       maintenance_team_id=equip.maintenance_team_id,
+                       assigned_technician=rng.choice(members_by_team[equip.maintenance_team_id]))
+        if row['stage'] in CLOSED_STAGES:
+            row['completed_at'] = min(created + timedelta(hours=rng.lognormvariate(3, 1)), now)
+        rows.append(row)
+        if len(rows) >= BATCH_SIZE:
+            bulk_insert(MaintenanceRequest, rows)
+            rows = []
+    bulk_insert(MaintenanceRequest, rows)
+
+    # Technicians come from the team member lists and names written above
+    link_technicians(db.session)
+    refresh_equipment_counters()
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--technicians-per-team', type=int, default=8)
+    parser.add_argument('--workcenters', type=int, default=500)
+    parser.add_argument('--equipment', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=730, help='Spread request history over this many days')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (also keeps generated keys unique)')
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate all tables first')
+    args = parser.parse_args()
+
+    if args.equipment < 1 or args.teams < 1:
+        parser.error('--equipment and --teams must be at least 1')
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+            # Before any data, so the triggers fill the search index and sync columns as in production
+            run_migrations()
+        started = time.perf_counter()
+        generate(args)
+        print(f"Generated {args.users} users, {args.teams} teams, {args.workcenters} work centers, "
+              f"{args.equipment} equipment and {args.requests} requests "
+              f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
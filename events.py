@@ -0,0 +1,95 @@
+"""
+In-process publish/subscribe broker for live Kanban updates.
+
+Write routes publish small change events after they commit. Every open
+dashboard holds one Server-Sent Events stream fed by its own bounded
+queue. A subscriber that falls too far behind is sent a "reset" event and
+dropped, and its page reloads instead of growing the queue without bound.
+
+The broker lives in the memory of one process. Run the app as a single
+gevent worker (see README) so every dashboard sees every change and idle
+streams wait on a greenlet instead of pinning an OS thread. Under a
+threaded or sync server each stream holds a thread for its whole life, so
+the number of open streams is capped (MAX_EVENT_STREAMS; by default 1000
+under gevent and 8 otherwise). A dashboard over the cap is answered 503
+and falls back to reloading every STREAM_RETRY_SECONDS.
+"""
+import json
+import os
+import queue
+import sys
+import threading
+
+HEARTBEAT_SECONDS = 15
+MAX_PENDING_EVENTS = 100
+STREAM_RETRY_SECONDS = 30
+
+
+def _gevent_patched():
+    # gunicorn's gevent worker patches threading before the app is imported
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+MAX_EVENT_STREAMS = int(os.getenv('MAX_EVENT_STREAMS', '1000' if _gevent_patched() else '8'))
+
+
+class Broker:
+    def __init__(self, max_pending=MAX_PENDING_EVENTS, max_subscribers=MAX_EVENT_STREAMS):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """A new subscriber queue, or None when max_subscribers streams are already open"""
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type, data):
+        message = (event_type, json.dumps(data))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Too slow to keep up: tell it to reload rather than buffer forever
+                self.unsubscribe(subscriber)
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(('reset', '{}'))
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+broker = Broker()
+
+
+def event_stream(subscriber, heartbeat=HEARTBEAT_SECONDS):
+    """Yield Server-Sent Events for one subscriber until the client goes away"""
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event_type, data = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            yield f'event: {event_type}\ndata: {data}\n\n'
+            if event_type == 'reset':
+                return
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,131 @@
+"""
+Streaming CSV/JSON export of maintenance requests and equipment.
+
+Rows are selected as plain column tuples (no ORM objects) with team,
+equipment and work center names joined in, fetched in batches of
+EXPORT_BATCH_SIZE (yield_per, i.e. a server-side cursor where the
+database supports one) and encoded as they arrive. The first bytes go out
+immediately and the full result set is never held in memory.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import select
+from models import db, Equipment, WorkCenter, MaintenanceRequest, MaintenanceTeam
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+
+
+def request_export_query(start=None, end=None, stage=None, team_id=None):
+    """Requests created in [start, end), optionally filtered by stage and team"""
+    stmt = select(
+        MaintenanceRequest.id,
+        MaintenanceRequest.subject,
+        MaintenanceRequest.request_type,
+        MaintenanceRequest.stage,
+        MaintenanceRequest.category,
+        Equipment.serial_number.label('equipment_serial'),
+        Equipment.name.label('equipment'),
+        WorkCenter.code.label('workcenter_code'),
+        WorkCenter.name.label('workcenter'),
+        MaintenanceTeam.name.label('team'),
+        MaintenanceRequest.assigned_technician,
+        MaintenanceRequest.scheduled_date,
+        MaintenanceRequest.duration_hours,
+        MaintenanceRequest.created_at
+    ).outerjoin(Equipment, MaintenanceRequest.equipment_id == Equipment.id) \
+     .outerjoin(WorkCenter, MaintenanceRequest.workcenter_id == WorkCenter.id) \
+     .outerjoin(MaintenanceTeam, MaintenanceRequest.maintenance_team_id == MaintenanceTeam.id)
+
+    if start:
+        stmt = stmt.where(MaintenanceRequest.created_at >= start)
+    if end:
+        stmt = stmt.where(MaintenanceRequest.created_at < end)
+    if stage:
+        stmt = stmt.where(MaintenanceRequest.stage == stage)
+    if team_id:
+        stmt = stmt.where(MaintenanceRequest.maintenance_team_id == team_id)
+    return stmt.order_by(MaintenanceRequest.id)
+
+
+def equipment_export_query(start=None, end=None, team_id=None):
+    """Equipment with its maintenance summary, optionally last maintained in [start, end)"""
+    stmt = select(
+        Equipment.id,
+        Equipment.name,
+        Equipment.serial_number,
+        Equipment.category,
+        Equipment.department,
+        Equipment.status,
+        Equipment.location,
+        MaintenanceTeam.name.label('team'),
+        Equipment.default_technician,
+        Equipment.assigned_employee,
+        Equipment.purchase_date,
+        Equipment.warranty_end,
+        Equipment.open_request_count,
+        Equipment.new_request_count,
+        Equipment.in_progress_request_count,
+        Equipment.last_maintenance_date
+    ).outerjoin(MaintenanceTeam, Equipment.maintenance_team_id == MaintenanceTeam.id)
+
+    if start:
+        stmt = stmt.where(Equipment.last_maintenance_date >= start)
+    if end:
+        stmt = stmt.where(Equipment.last_maintenance_date < end)
+    if team_id:
+        stmt = stmt.where(Equipment.maintenance_team_id == team_id)
+    return stmt.order_by(Equipment.id)
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _batches(stmt):
+    """Yield lists of up to EXPORT_BATCH_SIZE rows from a streamed result"""
+    result = db.session.execute(stmt, execution_options={'yield_per': EXPORT_BATCH_SIZE})
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def stream_csv(stmt):
+    """Yield the rows of stmt as CSV text, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in stmt.selected_columns])
+    yield buffer.getvalue()
+    for rows in _batches(stmt):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([[_value(value) for value in row] for row in rows])
+        yield buffer.getvalue()
+
+
+def stream_json(stmt):
+    """Yield the rows of stmt as a JSON array of objects, one chunk per batch"""
+    names = [column.name for column in stmt.selected_columns]
+    yield '['
+    separator = ''
+    for rows in _batches(stmt):
+        parts = []
+        for row in rows:
+            parts.append(separator + json.dumps({name: _value(value) for name, value in zip(names, row)}))
+            separator = ','
+        yield ''.join(parts)
+    yield ']'
+
+
+def stream_export(stmt, fmt):
+    return stream_csv(stmt) if fmt == 'csv' else stream_json(stmt)
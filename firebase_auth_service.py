@@ -1,36 +1,55 @@
-import firebase_admin
-from firebase_admin import auth as firebase_auth
-from models import db, User
+"""
+Authentication providers, selected with AUTH_PROVIDER:
+
+  local          (default) accounts and passwords in the local database only
+  firebase       local passwords, plus sign-in with Firebase ID tokens; new
+                 accounts are also created in Firebase
+  firebase-stub  the firebase provider with a local token verifier that
+                 accepts "stub:<email>" tokens, for tests and development
+                 without a Firebase project; it refuses every token unless
+                 the app runs in debug or testing mode (checked per token,
+                 since `python app.py` only turns debug on in app.run())
+
+The Firebase Admin SDK is imported and initialized on the first token
+check or account creation (firebase_config.initialize_firebase), not at
+startup. The SDK caches Google's public signing keys for as long as their
+Cache-Control allows, and verified tokens are additionally cached until
+they expire (at most TOKEN_CACHE_TTL seconds), so a repeated token costs
+no signature check.
+"""
+import os
 import re
+import time
+from flask import current_app
+from cache import TTLCache
+from models import db, User
+
+AUTH_PROVIDER = os.getenv('AUTH_PROVIDER', 'local')
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '300'))
+
+
+class LocalAuthProvider:
+    # Whether /login/token is offered
+    accepts_tokens = False
 
-class FirebaseAuthService:
     @staticmethod
     def validate_email(email):
         """Validate email format"""
         pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
         return re.match(pattern, email) is not None
 
-    @staticmethod
-    def create_user(email, password, display_name=None):
-        """Create a new user in Firebase and local database"""
+    def create_user(self, email, password, display_name=None):
+        """Create a new user in the local database"""
         try:
-            # In a real implementation, this would create the user in Firebase
-            # user_record = firebase_auth.create_user(
-            #     email=email,
-            #     password=password,
-            #     display_name=display_name
-            # )
-            
-            # For demo purposes, we'll simulate the Firebase user creation
-            # and create a local database entry
-            user = User(username=display_name or email.split('@')[0], 
-                       email=email)
-            user.set_password(password)  # Using the local password hashing
+            uid = self._create_remote_user(email, password, display_name)
+            user = User(username=display_name or email.split('@')[0],
+                        email=email)
+            user.set_password(password)
             db.session.add(user)
             db.session.commit()
-            
+
             return {
-                'uid': f'demo_user_{email.split("@")[0]}',
+                'uid': uid or f'demo_user_{email.split("@")[0]}',
                 'email': email,
                 'display_name': display_name or email.split('@')[0],
                 'success': True
@@ -39,16 +58,21 @@ class FirebaseAuthService:
             print(f"Error creating user: {e}")
             return {'success': False, 'error': str(e)}
 
-    @staticmethod
-    def verify_password(email, password):
-        """Verify user credentials (simulating Firebase auth)"""
+    def _create_remote_user(self, email, password, display_name):
+        """Create the account with an external identity provider; returns its uid"""
+        return None
+
+    def verify_password(self, email, password):
+        """Verify user credentials against the local database"""
         try:
-            # In a real implementation, this would use Firebase auth
-            # decoded_token = firebase_auth.verify_id_token(id_token)
-            # For demo purposes, we'll check against our local database
             user = User.query.filter_by(email=email).first()
             if user and user.check_password(password):
+                if user.password_needs_rehash():
+                    # Upgrade a hash made with an older method or cost while the plain password is at hand
+                    user.set_password(password)
+                    db.session.commit()
                 return {
+                    'user_id': user.id,
                     'uid': f'demo_user_{email.split("@")[0]}',
                     'email': email,
                     'username': user.username,
@@ -60,15 +84,74 @@ class FirebaseAuthService:
             print(f"Error verifying password: {e}")
             return {'success': False, 'error': str(e)}
 
-    @staticmethod
-    def get_user_by_token(token):
-        """Get user info from token (simulating Firebase auth)"""
-        # In a real implementation, this would verify the Firebase token
-        # For demo purposes, we'll return a mock user
-        return {
-            'uid': 'demo_user',
-            'email': 'demo@example.com',
-            'username': 'demo_user',
-            'role': 'user',
-            'success': True
-        }
\ No newline at end of file
+    def get_user_by_token(self, token):
+        """Get the local user an identity token belongs to"""
+        return {'success': False, 'error': 'Token sign-in is not enabled'}
+
+
+class FirebaseAuthProvider(LocalAuthProvider):
+    accepts_tokens = True
+
+    def __init__(self):
+        self._verified_tokens = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)
+
+    def _firebase_auth(self):
+        from firebase_config import initialize_firebase
+        return initialize_firebase()
+
+    def _create_remote_user(self, email, password, display_name):
+        record = self._firebase_auth().create_user(email=email, password=password, display_name=display_name)
+        return record.uid
+
+    def _verify_token(self, token):
+        """Decoded claims of a valid Firebase ID token; raises if it isn't one"""
+        return self._firebase_auth().verify_id_token(token)
+
+    def get_user_by_token(self, token):
+        """Get the local user a Firebase ID token belongs to, matched by email"""
+        try:
+            claims = self._verified_tokens.get(token)
+            if claims is None or claims.get('exp', float('inf')) <= time.time():
+                claims = self._verify_token(token)
+                self._verified_tokens.set(token, claims)
+            user = User.query.filter_by(email=claims.get('email')).first() if claims.get('email') else None
+            if user is None:
+                return {'success': False, 'error': 'No account for this token'}
+            return {
+                'user_id': user.id,
+                'uid': claims.get('uid') or claims.get('sub'),
+                'email': user.email,
+                'username': user.username,
+                'role': user.role,
+                'success': True
+            }
+        except Exception as e:
+            print(f"Error verifying token: {e}")
+            return {'success': False, 'error': str(e)}
+
+
+class StubFirebaseAuthProvider(FirebaseAuthProvider):
+    """Firebase provider that never contacts Firebase: tokens are "stub:<email>" """
+
+    def _create_remote_user(self, email, password, display_name):
+        return f'stub_{email.split("@")[0]}'
+
+    def _verify_token(self, token):
+        if not (current_app.debug or current_app.testing):
+            raise RuntimeError('Stub tokens are only accepted in debug or testing mode')
+        prefix, _, email = token.partition(':')
+        if prefix != 'stub' or not self.validate_email(email):
+            raise ValueError('Invalid stub token')
+        return {'uid': f'stub_{email.split("@")[0]}', 'email': email, 'exp': time.time() + 3600}
+
+
+AUTH_PROVIDERS = {
+    'local': LocalAuthProvider,
+    'firebase': FirebaseAuthProvider,
+    'firebase-stub': StubFirebaseAuthProvider,
+}
+
+if AUTH_PROVIDER not in AUTH_PROVIDERS:
+    raise RuntimeError(f'AUTH_PROVIDER must be one of {", ".join(AUTH_PROVIDERS)}, not {AUTH_PROVIDER!r}')
+
+auth_provider = AUTH_PROVIDERS[AUTH_PROVIDER]()
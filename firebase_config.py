@@ -1,25 +1,32 @@
-import firebase_admin
-from firebase_admin import credentials, auth
 import os
 
+_auth_module = None
+
+
 # Initialize Firebase Admin SDK
 def initialize_firebase():
+    """
+    Import and initialize the Firebase Admin SDK on first use and return its
+    auth module. Nothing imports firebase_admin until a Firebase auth
+    provider actually needs it, so workers and scripts that never verify a
+    Firebase token don't pay for the import.
+    """
+    global _auth_module
+    if _auth_module is not None:
+        return _auth_module
+
+    import firebase_admin
+    from firebase_admin import credentials, auth
+
     # Check if Firebase is already initialized
     if not firebase_admin._apps:
-        try:
-            # You would normally use a service account key file here
-            # For now, we'll use environment variable or dummy initialization
-            cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
-            if cred_path and os.path.exists(cred_path):
-                cred = credentials.Certificate(cred_path)
-                firebase_admin.initialize_app(cred)
-            else:
-                # For demo purposes, we'll initialize without credentials
-                # In production, you need to set up a proper service account
-                print("Firebase Admin SDK initialized in demo mode")
-        except Exception as e:
-            print(f"Firebase initialization error: {e}")
-            # For demo purposes, we'll continue without Firebase
-            pass
-
-initialize_firebase()
\ No newline at end of file
+        cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
+        project_id = os.getenv('FIREBASE_PROJECT_ID')
+        options = {'projectId': project_id} if project_id else None
+        if cred_path and os.path.exists(cred_path):
+            firebase_admin.initialize_app(credentials.Certificate(cred_path), options)
+        else:
+            # Application default credentials; verifying ID tokens only needs the project id
+            firebase_admin.initialize_app(options=options)
+    _auth_module = auth
+    return auth
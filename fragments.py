@@ -0,0 +1,180 @@
+"""
+Cached rendered fragments for the read-mostly pages wall screens poll.
+
+The Kanban board, the teams grid, the work center list and the calendar's
+event feed are rendered once and then served from a cache until a table
+they are built from changes. Each cached entry's key includes a version
+counter for every table the fragment reads. Every committed session that
+wrote one of TRACKED_TABLES (through the unit of work or a bulk
+session.execute) bumps that table's counter after the commit, so the next
+read misses and re-renders. An unchanged page is served without touching
+the database.
+
+The store is chosen by FRAGMENT_CACHE_URL:
+
+  unset             an in-process LRU (FRAGMENT_CACHE_SIZE entries). Version
+                    bumps only reach the process that made the write, so
+                    another worker can serve a stale fragment until it
+                    expires; the TTL therefore defaults to 10 seconds, which
+                    still absorbs many screens polling at once
+  redis://host/db   a shared Redis (or compatible) server, needs the redis
+                    package; every worker sees every version bump, and the
+                    TTL defaults to 300 seconds
+
+Run more than one worker process with the in-process store only if pages
+up to FRAGMENT_CACHE_TTL seconds old are acceptable; otherwise set
+FRAGMENT_CACHE_URL. FRAGMENT_CACHE_TTL=0 disables fragment caching.
+"""
+import os
+import threading
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from cache import TTLCache
+
+FRAGMENT_CACHE_URL = os.getenv('FRAGMENT_CACHE_URL', '')
+FRAGMENT_CACHE_TTL = float(os.getenv('FRAGMENT_CACHE_TTL', '300' if FRAGMENT_CACHE_URL else '10'))
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '512'))
+KEY_PREFIX = 'gearguard:'
+
+# Tables whose writes invalidate fragments
+TRACKED_TABLES = frozenset({'maintenance_requests', 'equipment', 'workcenters', 'maintenance_teams',
+                            'technicians', 'team_memberships'})
+
+
+class LocalFragmentStore:
+    """Fragments in a per-process TTL/LRU cache, versions in a dict"""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def versions(self, tables):
+        with self._lock:
+            return [self._versions.get(table, 0) for table in tables]
+
+    def bump(self, tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def clear(self):
+        self._cache.clear()
+
+
+class RedisFragmentStore:
+    """Fragments and versions in Redis, shared by every worker"""
+
+    def __init__(self, url, ttl):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._errors = redis.RedisError
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self._redis.get(KEY_PREFIX + 'fragment:' + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value):
+        self._redis.set(KEY_PREFIX + 'fragment:' + key, value.encode(), ex=max(int(self.ttl), 1))
+
+    def versions(self, tables):
+        return [int(value or 0) for value in self._redis.mget([KEY_PREFIX + 'version:' + table for table in tables])]
+
+    def bump(self, tables):
+        pipeline = self._redis.pipeline(transaction=False)
+        for table in tables:
+            pipeline.incr(KEY_PREFIX + 'version:' + table)
+        pipeline.execute()
+
+    def clear(self):
+        for key in self._redis.scan_iter(KEY_PREFIX + 'fragment:*'):
+            self._redis.delete(key)
+
+
+def _create_store():
+    if FRAGMENT_CACHE_TTL <= 0:
+        return None
+    if FRAGMENT_CACHE_URL:
+        return RedisFragmentStore(FRAGMENT_CACHE_URL, FRAGMENT_CACHE_TTL)
+    return LocalFragmentStore(FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_TTL)
+
+
+store = _create_store()
+
+
+def cached_fragment(name, tables, render, *key_parts):
+    """
+    The text render() returns, from the cache when none of `tables` has
+    been written since it was stored. `name` and `key_parts` identify the
+    fragment (e.g. a date range); render must return a str.
+    """
+    if store is None:
+        return render()
+    try:
+        versions = store.versions(tables)
+        key = ':'.join([name, *map(str, key_parts), '.'.join(map(str, versions))])
+        value = store.get(key)
+    except Exception as error:
+        # A cache outage degrades to rendering every time, never to an error page
+        current_app.logger.warning('Fragment cache unavailable: %s', error)
+        return render()
+    if value is None:
+        value = render()
+        try:
+            store.set(key, value)
+        except Exception as error:
+            current_app.logger.warning('Fragment cache unavailable: %s', error)
+    return value
+
+
+def invalidate_tables(tables):
+    """Bump the versions of `tables`, for writes made outside a session"""
+    tables = sorted(TRACKED_TABLES.intersection(tables))
+    if store is not None and tables:
+        try:
+            store.bump(tables)
+        except Exception as error:
+            current_app.logger.warning('Fragment cache unavailable: %s', error)
+
+
+def _written_tables(session):
+    return session.info.setdefault('fragment_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    written = _written_tables(session)
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        written.add(instance.__table__.name)
+    # Relationship collections backed by an association table
+    if any(instance.__table__.name in ('maintenance_teams', 'technicians') for instance in session.dirty):
+        written.add('team_memberships')
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_executed_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and getattr(table, 'name', None):
+            _written_tables(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_tables(session):
+    # Bumped only once the data is visible, so a concurrent read can't cache the old rows under the new version
+    written = session.info.pop('fragment_tables', None)
+    if written:
+        invalidate_tables(written)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_tables(session):
+    session.info.pop('fragment_tables', None)
@@ -0,0 +1,359 @@
+"""
+Streaming bulk import of equipment, work centers and maintenance requests.
+
+Rows are read from CSV (with a header row) or JSONL one at a time, validated,
+and written in chunks: each chunk is one executemany INSERT inside one
+transaction. Bad rows are reported with their line number and skipped
+without aborting the file. Only one chunk and at most MAX_REPORTED_ERRORS
+errors are held in memory, so memory use doesn't grow with file size.
+
+Columns (CSV headers / JSON keys):
+  equipment:   name, serial_number, category, department, [assigned_employee,
+               maintenance_team (name or id), default_technician, purchase_date,
+               warranty_end, location, status, notes]
+  workcenters: name, code, [location, department, responsible_person,
+               description, status]
+  requests:    subject, request_type, equipment_serial or workcenter_code,
+               [assigned_technician, scheduled_date, duration_hours, stage,
+               completed_at (closed stages; defaults to the import time)]
+"""
+import csv
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, Equipment, WorkCenter, MaintenanceRequest, MaintenanceTeam, REQUEST_STAGES, CLOSED_STAGES
+from counters import refresh_equipment_counters
+from technicians import technician_ids
+from audit import audited_insert
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_KINDS = ('equipment', 'workcenters', 'requests')
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []  # (line number, message), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def truncated_errors(self):
+        return self.failed - len(self.errors)
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict or error message) from a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {key.strip(): value for key, value in row.items() if key}
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, 'Each line must be a JSON object'
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _text(row, key, required=False, max_length=None):
+    value = row.get(key)
+    value = str(value).strip() if value is not None else ''
+    if required and not value:
+        raise ValueError(f'{key} is required')
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{key} is longer than {max_length} characters')
+    return value or None
+
+
+def _choice(row, key, choices, default):
+    value = _text(row, key) or default
+    if value not in choices:
+        raise ValueError(f'{key} must be one of {", ".join(choices)}')
+    return value
+
+
+def _date(row, key):
+    value = _text(row, key)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{key} must be a YYYY-MM-DD date')
+
+
+def _datetime(row, key):
+    value = _text(row, key)
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f'{key} must be a YYYY-MM-DD HH:MM date and time')
+
+
+def _number(row, key):
+    value = _text(row, key)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{key} must be a number')
+
+
+class _Importer(ABC):
+    """Validates and inserts rows of one kind; subclasses define the columns"""
+    model = None
+    unique_column = None
+
+    def __init__(self):
+        # Teams are a short list, so they are resolved from memory
+        self.teams = {}
+        for team in MaintenanceTeam.query.all():
+            self.teams[str(team.id)] = team.id
+            self.teams[team.name.strip().lower()] = team.id
+
+    def team_id(self, row):
+        value = _text(row, 'maintenance_team') or _text(row, 'maintenance_team_id')
+        if not value:
+            return None
+        team_id = self.teams.get(value.lower())
+        if team_id is None:
+            raise ValueError(f'Unknown maintenance team: {value}')
+        return team_id
+
+    @abstractmethod
+    def validate(self, row):
+        """Return the column values for one row or raise ValueError"""
+
+    def resolve(self, chunk, result):
+        """Chunk-level checks that need the database; returns the rows to insert"""
+        if not self.unique_column:
+            return chunk
+        column = getattr(self.model, self.unique_column)
+        values = [values[self.unique_column] for _, values in chunk]
+        existing = set(db.session.scalars(select(column).where(column.in_(values))))
+        rows, seen = [], set()
+        for line, values in chunk:
+            key = values[self.unique_column]
+            if key in existing or key in seen:
+                result.add_error(line, f'{self.unique_column} {key} already exists')
+                continue
+            seen.add(key)
+            rows.append((line, values))
+        return rows
+
+    def resolve_technicians(self, rows):
+        """
+        Set the technician ids from the names, creating new technicians in the
+        chunk's transaction. Run again after a rollback, which discards them.
+        """
+
+    def after_insert(self, rows):
+        """Hook run in the chunk's transaction after its rows are inserted"""
+
+
+class EquipmentImporter(_Importer):
+    model = Equipment
+    unique_column = 'serial_number'
+
+    def validate(self, row):
+        return {
+            'name': _text(row, 'name', required=True, max_length=100),
+            'serial_number': _text(row, 'serial_number', required=True, max_length=100),
+            'category': _text(row, 'category', required=True, max_length=50),
+            'department': _text(row, 'department', required=True, max_length=50),
+            'assigned_employee': _text(row, 'assigned_employee', max_length=100),
+            'maintenance_team_id': self.team_id(row),
+            'default_technician': _text(row, 'default_technician', max_length=100),
+            'purchase_date': _date(row, 'purchase_date'),
+            'warranty_end': _date(row, 'warranty_end'),
+            'location': _text(row, 'location', max_length=100),
+            'status': _choice(row, 'status', ('Active', 'Scrapped'), 'Active'),
+            'notes': _text(row, 'notes'),
+        }
+
+    def resolve_technicians(self, rows):
+        ids = technician_ids(values['default_technician'] for _, values in rows)
+        for _, values in rows:
+            values['default_technician_id'] = ids.get(values['default_technician'])
+
+
+class WorkCenterImporter(_Importer):
+    model = WorkCenter
+    unique_column = 'code'
+
+    def validate(self, row):
+        return {
+            'name': _text(row, 'name', required=True, max_length=100),
+            'code': _text(row, 'code', required=True, max_length=50),
+            'location': _text(row, 'location', max_length=100),
+            'department': _text(row, 'department', max_length=50),
+            'responsible_person': _text(row, 'responsible_person', max_length=100),
+            'description': _text(row, 'description'),
+            'status': _choice(row, 'status', ('Active', 'Inactive'), 'Active'),
+        }
+
+
+class RequestImporter(_Importer):
+    model = MaintenanceRequest
+
+    def validate(self, row):
+        values = {
+            'subject': _text(row, 'subject', required=True, max_length=200),
+            'request_type': _choice(row, 'request_type', ('Corrective', 'Preventive'), None),
+            'equipment_serial': _text(row, 'equipment_serial'),
+            'workcenter_code': _text(row, 'workcenter_code'),
+            'assigned_technician': _text(row, 'assigned_technician', max_length=100),
+            'scheduled_date': _datetime(row, 'scheduled_date'),
+            'duration_hours': _number(row, 'duration_hours'),
+            'stage': _choice(row, 'stage', REQUEST_STAGES, 'New'),
+            'completed_at': _datetime(row, 'completed_at'),
+        }
+        if values['stage'] not in CLOSED_STAGES:
+            values['completed_at'] = None
+        elif values['completed_at'] is None:
+            values['completed_at'] = datetime.utcnow()
+        if bool(values['equipment_serial']) == bool(values['workcenter_code']):
+            raise ValueError('exactly one of equipment_serial or workcenter_code is required')
+        return values
+
+    def resolve(self, chunk, result):
+        # Look up the chunk's equipment and work centers in two queries
+        serials = {values['equipment_serial'] for _, values in chunk if values['equipment_serial']}
+        codes = {values['workcenter_code'] for _, values in chunk if values['workcenter_code']}
+        equipment = {}
+        if serials:
+            equipment = {row.serial_number: row for row in db.session.execute(
+                select(Equipment.id, Equipment.serial_number, Equipment.category,
+                       Equipment.maintenance_team_id, Equipment.default_technician_id,
+                       Equipment.default_technician)
+                .where(Equipment.serial_number.in_(serials)))}
+        workcenters = {}
+        if codes:
+            workcenters = {row.code: row for row in db.session.execute(
+                select(WorkCenter.id, WorkCenter.code, WorkCenter.department)
+                .where(WorkCenter.code.in_(codes)))}
+
+        rows = []
+        for line, values in chunk:
+            serial = values.pop('equipment_serial')
+            code = values.pop('workcenter_code')
+            values.update(equipment_id=None, workcenter_id=None, category=None, maintenance_team_id=None)
+            if serial:
+                equip = equipment.get(serial)
+                if equip is None:
+                    result.add_error(line, f'Unknown equipment serial number: {serial}')
+                    continue
+                # Same defaults as create_request()
+                values.update(equipment_id=equip.id, category=equip.category,
+                              maintenance_team_id=equip.maintenance_team_id)
+                if not values['assigned_technician']:
+                    values['assigned_technician'] = equip.default_technician
+                    values['assigned_technician_id'] = equip.default_technician_id
+            else:
+                workcenter = workcenters.get(code)
+                if workcenter is None:
+                    result.add_error(line, f'Unknown work center code: {code}')
+                    continue
+                values.update(workcenter_id=workcenter.id, category=workcenter.department)
+            rows.append((line, values))
+        # Rows without the equipment's default technician name one themselves
+        self.named = [values for _, values in rows if 'assigned_technician_id' not in values]
+        return rows
+
+    def resolve_technicians(self, rows):
+        ids = technician_ids(values['assigned_technician'] for values in self.named)
+        for values in self.named:
+            values['assigned_technician_id'] = ids.get(values['assigned_technician'])
+
+    def after_insert(self, rows):
+        refresh_equipment_counters({values['equipment_id'] for _, values in rows})
+
+
+IMPORTERS = {
+    'equipment': EquipmentImporter,
+    'workcenters': WorkCenterImporter,
+    'requests': RequestImporter,
+}
+
+
+def _write_chunk(importer, chunk, result):
+    rows = importer.resolve(chunk, result)
+    if not rows:
+        db.session.rollback()
+        return
+    try:
+        importer.resolve_technicians(rows)
+        audited_insert(importer.model, [values for _, values in rows])
+        importer.after_insert(rows)
+        db.session.commit()
+        result.inserted += len(rows)
+        return
+    except IntegrityError:
+        db.session.rollback()
+
+    # Something in the batch violates a constraint: retry row by row to find it.
+    # The rollback dropped any technicians created for the chunk, so create them again.
+    importer.resolve_technicians(rows)
+    inserted = []
+    for line, values in rows:
+        try:
+            with db.session.begin_nested():
+                audited_insert(importer.model, [values])
+            inserted.append((line, values))
+        except IntegrityError as e:
+            result.add_error(line, str(e.orig))
+    importer.after_insert(inserted)
+    db.session.commit()
+    result.inserted += len(inserted)
+
+
+def import_stream(stream, kind, fmt='csv', chunk_size=CHUNK_SIZE):
+    """Import rows of `kind` from a text stream; returns an ImportResult"""
+    if kind not in IMPORTERS:
+        raise ValueError(f'Unknown import kind: {kind}')
+    importer = IMPORTERS[kind]()
+    result = ImportResult()
+    chunk = []
+    for line, row in iter_rows(stream, fmt):
+        if isinstance(row, str):
+            result.add_error(line, row)
+            continue
+        try:
+            chunk.append((line, importer.validate(row)))
+        except ValueError as e:
+            result.add_error(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _write_chunk(importer, chunk, result)
+            chunk = []
+    if chunk:
+        _write_chunk(importer, chunk, result)
+    return result
+
+
+def detect_format(filename):
+    """Guess the format from a file name: .jsonl/.ndjson are JSONL, anything else CSV"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
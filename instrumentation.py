@@ -0,0 +1,172 @@
+"""
+Per-request SQL and render instrumentation.
+
+Counts the SQL statements each request issues and times them (SQLAlchemy
+engine events), times template rendering (Flask signals) and logs slow
+statements with their parameters. Per-request numbers are sent as X-*
+response headers in debug mode. Totals per endpoint are kept in process
+and exposed at /metrics in the Prometheus text format.
+
+Settings (environment):
+  SLOW_QUERY_MS   statements slower than this are logged (default 100)
+  METRICS_TOKEN   if set, /metrics requires "Authorization: Bearer <token>";
+                  otherwise it is served only to logged-in admins, or to
+                  anyone in debug mode
+"""
+import os
+import threading
+import time
+from flask import (g, request, current_app, has_request_context, Response, abort,
+                   before_render_template, template_rendered)
+from sqlalchemy import event
+from models import db
+from auth import load_current_user
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+# (metric name, help text, field of EndpointStats)
+METRICS = [
+    ('gearguard_http_requests_total', 'Requests handled', 'requests'),
+    ('gearguard_http_request_seconds_total', 'Time spent handling requests', 'request_seconds'),
+    ('gearguard_db_queries_total', 'SQL statements executed', 'queries'),
+    ('gearguard_db_seconds_total', 'Time spent executing SQL', 'db_seconds'),
+    ('gearguard_render_seconds_total', 'Time spent rendering templates', 'render_seconds'),
+    ('gearguard_db_slow_queries_total', f'SQL statements slower than {SLOW_QUERY_MS:g}ms', 'slow_queries'),
+]
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.slow_queries = 0
+        self.render_started = []
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.request_seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.slow_queries = 0
+
+
+class MetricsRegistry:
+    """Process-wide totals per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, stats, request_seconds):
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, EndpointStats())
+            totals.requests += 1
+            totals.request_seconds += request_seconds
+            totals.queries += stats.queries
+            totals.db_seconds += stats.db_seconds
+            totals.render_seconds += stats.render_seconds
+            totals.slow_queries += stats.slow_queries
+
+    def render_prometheus(self):
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+            for name, help_text, field in METRICS:
+                lines.append(f'# HELP {name} {help_text}, by endpoint')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, totals in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {getattr(totals, field):g}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own execution context: a statement that raises never
+    # reaches the after hook, and a per-connection stack would then skew later timings
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current_stats()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        stats.slow_queries += 1
+        current_app.logger.warning('Slow query (%.1f ms) in %s: %s params=%r',
+                                   elapsed * 1000, request.endpoint, ' '.join(statement.split()), parameters)
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats.render_started.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None and stats.render_started:
+        elapsed = time.perf_counter() - stats.render_started.pop()
+        # Only count the outermost render so nested render_template calls aren't counted twice
+        if not stats.render_started:
+            stats.render_seconds += elapsed
+
+
+def init_instrumentation(app):
+    """Attach the engine listeners, request hooks and /metrics endpoint to app"""
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        request_seconds = time.perf_counter() - stats.started
+        registry.record(request.endpoint or 'unmatched', stats, request_seconds)
+        if app.debug:
+            response.headers['X-Query-Count'] = str(stats.queries)
+            response.headers['X-DB-Time-Ms'] = f'{stats.db_seconds * 1000:.2f}'
+            response.headers['X-Render-Time-Ms'] = f'{stats.render_seconds * 1000:.2f}'
+            response.headers['X-Request-Time-Ms'] = f'{request_seconds * 1000:.2f}'
+            response.headers['X-Slow-Query-Count'] = str(stats.slow_queries)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = os.getenv('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(401)
+        elif not app.debug:
+            user = load_current_user()
+            if user is None or user.role != 'admin':
+                abort(403)
+        return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
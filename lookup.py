@@ -0,0 +1,86 @@
+"""
+Typeahead lookups behind the form pickers (static/picker.js).
+
+Forms used to render every equipment, work center and team as <select>
+options, so their size grew with the inventory. A picker instead asks
+/lookup/<kind>?q=&limit= for a bounded number of matches as the user
+types. Equipment and work centers are matched against the title column of
+the search index (word prefixes of the name and serial number or code);
+teams, of which there are few, by name prefix. An empty query lists the
+first rows by name.
+
+Results are kept in a short-TTL in-process cache (LOOKUP_CACHE_TTL seconds,
+0 disables it) that is cleared whenever one of the looked-up tables is
+written through the ORM in this process.
+"""
+import os
+from sqlalchemy import event, select
+from cache import TTLCache
+from models import db, Equipment, WorkCenter, MaintenanceTeam
+from search import search, MIN_PREFIX_LENGTH
+
+DEFAULT_LOOKUP_LIMIT = 20
+MAX_LOOKUP_LIMIT = 50
+LOOKUP_CACHE_TTL = float(os.getenv('LOOKUP_CACHE_TTL', '30'))
+
+_lookup_cache = TTLCache(maxsize=int(os.getenv('LOOKUP_CACHE_SIZE', '2048')), ttl=LOOKUP_CACHE_TTL)
+
+# kind -> model, search index kind (None: name prefix only), columns and the option's detail column
+LOOKUPS = {
+    'equipment': {
+        'model': Equipment,
+        'search_kind': 'equipment',
+        'select': select(Equipment.id, Equipment.name.label('label'), Equipment.serial_number.label('detail'),
+                         Equipment.category, Equipment.status, Equipment.maintenance_team_id,
+                         MaintenanceTeam.name.label('maintenance_team'))
+                  .outerjoin(MaintenanceTeam, MaintenanceTeam.id == Equipment.maintenance_team_id),
+    },
+    'workcenters': {
+        'model': WorkCenter,
+        'search_kind': 'workcenter',
+        'select': select(WorkCenter.id, WorkCenter.name.label('label'), WorkCenter.code.label('detail'),
+                         WorkCenter.department, WorkCenter.status),
+    },
+    'teams': {
+        'model': MaintenanceTeam,
+        'search_kind': None,
+        'select': select(MaintenanceTeam.id, MaintenanceTeam.name.label('label')),
+    },
+}
+
+
+def lookup(kind, query='', limit=DEFAULT_LOOKUP_LIMIT):
+    """Up to `limit` options of `kind` matching `query`, as dicts with id, label and the kind's extra fields"""
+    limit = min(max(limit or DEFAULT_LOOKUP_LIMIT, 1), MAX_LOOKUP_LIMIT)
+    query = ' '.join((query or '').lower().split())
+    key = (kind, query, limit)
+    if LOOKUP_CACHE_TTL > 0:
+        cached = _lookup_cache.get(key)
+        if cached is not None:
+            return cached
+    options = [dict(row._mapping) for row in _lookup_rows(LOOKUPS[kind], query, limit)]
+    if LOOKUP_CACHE_TTL > 0:
+        _lookup_cache.set(key, options)
+    return options
+
+
+def _lookup_rows(spec, query, limit):
+    model, statement = spec['model'], spec['select']
+    if not query:
+        return db.session.execute(statement.order_by(model.name, model.id).limit(limit)).all()
+    if spec['search_kind'] and len(query) >= MIN_PREFIX_LENGTH:
+        ids = [result['id'] for result in search(query, spec['search_kind'], limit, titles_only=True)]
+        rows = {row.id: row for row in db.session.execute(statement.where(model.id.in_(ids)))}
+        return [rows[id] for id in ids if id in rows]
+    return db.session.execute(statement.where(model.name.istartswith(query, autoescape=True))
+                              .order_by(model.name, model.id).limit(limit)).all()
+
+
+def clear_lookup_cache():
+    _lookup_cache.clear()
+
+
+# Options embed names across tables (an equipment option carries its team's name), so any write clears them all
+for _model in (Equipment, WorkCenter, MaintenanceTeam):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, lambda mapper, connection, target: clear_lookup_cache())
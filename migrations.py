@@ -0,0 +1,181 @@
+"""
+Lightweight schema migrations.
+
+db.create_all() only creates tables that are missing, so columns and
+indexes added to existing tables are applied here. Every migration is
+idempotent (a fresh database already has the schema from create_all) and
+is recorded in the schema_migrations table so it runs only once.
+"""
+from datetime import datetime
+from sqlalchemy import inspect
+from models import db, User, Equipment, MaintenanceRequest, MaintenanceTeam, WorkCenter, CLOSED_STAGES
+from counters import equipment_counters_update
+from technicians import link_technicians
+from search import install_search_index
+from sync import install_sync_triggers
+from audit import install_audit_guards
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, default=datetime.utcnow)
+)
+
+
+def create_indexes(conn, table):
+    """Create any of the table's declared indexes that don't exist yet.
+
+    Indexes over columns that a later migration adds are left for that migration.
+    """
+    existing = {col['name'] for col in inspect(conn).get_columns(table.name)}
+    for index in table.indexes:
+        if all(col.name in existing for col in index.columns):
+            index.create(conn, checkfirst=True)
+
+
+def add_column(conn, table_name, column):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    existing = {col['name'] for col in inspect(conn).get_columns(table_name)}
+    if column.name not in existing:
+        ddl = f'ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}'
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += ' NOT NULL'
+        conn.exec_driver_sql(ddl)
+
+
+def add_request_indexes(conn):
+    create_indexes(conn, MaintenanceRequest.__table__)
+
+
+def add_list_indexes(conn):
+    create_indexes(conn, Equipment.__table__)
+    create_indexes(conn, MaintenanceRequest.__table__)
+
+
+def add_equipment_counters(conn):
+    for name in ('open_request_count', 'new_request_count', 'in_progress_request_count',
+                 'last_maintenance_date'):
+        add_column(conn, 'equipment', Equipment.__table__.c[name])
+    # The backfill UPDATE also stamps updated_at (migration 5) and reads completed_at (migration 10),
+    # so those columns must exist first
+    add_column(conn, 'equipment', Equipment.__table__.c.updated_at)
+    add_column(conn, 'maintenance_requests', MaintenanceRequest.__table__.c.completed_at)
+    conn.execute(equipment_counters_update())
+
+
+def add_updated_at(conn):
+    now = datetime.utcnow()
+    for model in (MaintenanceRequest, Equipment, WorkCenter, MaintenanceTeam):
+        table = model.__table__
+        add_column(conn, table.name, table.c.updated_at)
+        # Rows that know when they were created start from that, the rest from now
+        backfill = table.c.created_at if 'created_at' in table.c else None
+        conn.execute(table.update().where(table.c.updated_at.is_(None))
+                     .values(updated_at=db.func.coalesce(backfill, now) if backfill is not None else now))
+        create_indexes(conn, table)
+
+
+def add_recurrence(conn):
+    # recurrence_rules itself is new, so create_all has made it
+    add_column(conn, 'equipment', Equipment.__table__.c.operating_hours)
+    add_column(conn, 'maintenance_requests', MaintenanceRequest.__table__.c.recurrence_rule_id)
+    create_indexes(conn, MaintenanceRequest.__table__)
+
+
+def add_technicians(conn):
+    # technicians and team_memberships are new tables, so create_all has made them
+    add_column(conn, 'equipment', Equipment.__table__.c.default_technician_id)
+    add_column(conn, 'maintenance_requests', MaintenanceRequest.__table__.c.assigned_technician_id)
+    create_indexes(conn, Equipment.__table__)
+    create_indexes(conn, MaintenanceRequest.__table__)
+    # Data migration: team member lists and technician names become Technician rows
+    link_technicians(conn)
+
+
+def add_search_index(conn):
+    # FTS5 is SQLite-only; other databases use search.py's LIKE fallback
+    if conn.dialect.name == 'sqlite':
+        install_search_index(conn)
+
+
+def add_workcenter_name_index(conn):
+    create_indexes(conn, WorkCenter.__table__)
+
+
+def add_request_rollups(conn):
+    # The rollup tables are new, so create_all has made them
+    table = MaintenanceRequest.__table__
+    add_column(conn, table.name, table.c.completed_at)
+    # The real closing time is unknown for older requests; their last change is the best estimate
+    conn.execute(table.update()
+                 .where(table.c.stage.in_(CLOSED_STAGES), table.c.completed_at.is_(None))
+                 .values(completed_at=db.func.coalesce(table.c.updated_at, table.c.created_at),
+                         updated_at=table.c.updated_at))
+    create_indexes(conn, table)
+
+
+def widen_password_hash(conn):
+    # scrypt hashes are 162 characters; SQLite doesn't enforce VARCHAR lengths, other databases do
+    column_type = User.__table__.c.password_hash.type.compile(dialect=conn.dialect)
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql(f'ALTER TABLE users ALTER COLUMN password_hash TYPE {column_type}')
+    elif conn.dialect.name in ('mysql', 'mariadb'):
+        conn.exec_driver_sql(f'ALTER TABLE users MODIFY password_hash {column_type} NOT NULL')
+
+
+def add_sync_columns(conn):
+    # sync_sequences and sync_tombstones are new tables, so create_all has made them
+    table = MaintenanceRequest.__table__
+    add_column(conn, table.name, table.c.change_seq)
+    add_column(conn, table.name, table.c.row_version)
+    create_indexes(conn, table)
+    # Triggers are SQLite-only, like the search index; sync is unavailable elsewhere
+    if conn.dialect.name == 'sqlite':
+        install_sync_triggers(conn)
+
+
+def add_audit_log(conn):
+    # audit_events and audit_events_archive are new tables, so create_all has made them
+    if conn.dialect.name == 'sqlite':
+        install_audit_guards(conn)
+
+
+def recount_last_maintenance(conn):
+    # last_maintenance_date now comes from completed_at
+    conn.execute(equipment_counters_update())
+
+
+# (version, name, function) - append only, never reorder
+MIGRATIONS = [
+    (1, 'maintenance request composite indexes', add_request_indexes),
+    (2, 'equipment and request list indexes', add_list_indexes),
+    (3, 'maintenance request scheduled date index', add_request_indexes),
+    (4, 'equipment request counters', add_equipment_counters),
+    (5, 'updated_at timestamps', add_updated_at),
+    (6, 'preventive recurrence rules', add_recurrence),
+    (7, 'technician table and team memberships', add_technicians),
+    (8, 'full-text search index', add_search_index),
+    (9, 'work center name index', add_workcenter_name_index),
+    (10, 'request completion time and daily rollups', add_request_rollups),
+    (11, 'longer password hashes', widen_password_hash),
+    (12, 'request change sequence and row versions for sync', add_sync_columns),
+    (13, 'append-only audit log', add_audit_log),
+    (14, 'last maintenance date from completion time', recount_last_maintenance),
+]
+
+
+def run_migrations():
+    """Apply pending migrations in order. Safe to call on every startup."""
+    with db.engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        applied = {row.version for row in conn.execute(schema_migrations.select())}
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name,
+                                                           applied_at=datetime.utcnow()))
+            print(f"Applied migration {version}: {name}")
@@ -1,37 +1,84 @@
+import os
+from functools import lru_cache
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash, check_password_hash
 db = SQLAlchemy()
 
+# Werkzeug hash method and cost for new passwords, e.g. "scrypt:16384:8:1" or "pbkdf2:sha256:600000".
+# Stored hashes made with anything else are upgraded on the user's next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+
+@lru_cache(maxsize=None)
+def password_hash_prefix(method):
+    """The method:params prefix werkzeug writes for `method`, with its default parameters filled in"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+# Kanban workflow stages, in board order
+REQUEST_STAGES = ['New', 'In Progress', 'Repaired', 'Scrap']
+# Stages that end a request; entering one stamps completed_at
+CLOSED_STAGES = ('Repaired', 'Scrap')
+
 class User(db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), default='user')  # admin, manager, user
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        return self.password_hash.split('$', 1)[0] != password_hash_prefix(PASSWORD_HASH_METHOD)
+    
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Which technicians belong to which teams
+team_memberships = db.Table(
+    'team_memberships',
+    db.Column('team_id', db.Integer, db.ForeignKey('maintenance_teams.id'), primary_key=True),
+    db.Column('technician_id', db.Integer, db.ForeignKey('technicians.id'), primary_key=True),
+    db.Index('ix_team_memberships_technician', 'technician_id')
+)
+
 class MaintenanceTeam(db.Model):
     __tablename__ = 'maintenance_teams'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    members = db.Column(db.Text)  # Comma-separated list of technician names
+    members = db.Column(db.Text)  # Comma-separated technician names as entered; team_memberships is authoritative
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    technicians = db.relationship('Technician', secondary=team_memberships, back_populates='teams',
+                                  order_by='Technician.name')
     
     def __repr__(self):
         return f'<MaintenanceTeam {self.name}>'
 
+class Technician(db.Model):
+    __tablename__ = 'technicians'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    teams = db.relationship('MaintenanceTeam', secondary=team_memberships, back_populates='technicians',
+                            order_by='MaintenanceTeam.name')
+    
+    def __repr__(self):
+        return f'<Technician {self.name}>'
+
 class Equipment(db.Model):
     __tablename__ = 'equipment'
     
@@ -42,15 +89,39 @@ class Equipment(db.Model):
     department = db.Column(db.String(50), nullable=False)  # Production / Admin / IT
     assigned_employee = db.Column(db.String(100))
     maintenance_team_id = db.Column(db.Integer, db.ForeignKey('maintenance_teams.id'))
-    default_technician = db.Column(db.String(100))
+    default_technician_id = db.Column(db.Integer, db.ForeignKey('technicians.id'), index=True)
+    default_technician = db.Column(db.String(100))  # Name of default_technician_id, kept for display and exports
     purchase_date = db.Column(db.Date)
     warranty_end = db.Column(db.Date)
     location = db.Column(db.String(100))
     status = db.Column(db.String(20), default='Active')  # Active / Scrapped
     notes = db.Column(db.Text)
     
+    # Denormalized request counters, maintained by counters.refresh_equipment_counters
+    open_request_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    new_request_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    in_progress_request_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_maintenance_date = db.Column(db.DateTime)
+    # Meter reading that drives operating-hour recurrence rules
+    operating_hours = db.Column(db.Float, default=0, server_default='0', nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Indexes backing the sortable, filterable equipment list
+    __table_args__ = (
+        db.Index('ix_equipment_name', 'name'),
+        db.Index('ix_equipment_category_name', 'category', 'name'),
+        db.Index('ix_equipment_department_name', 'department', 'name'),
+        db.Index('ix_equipment_team_name', 'maintenance_team_id', 'name'),
+    )
+    
     # Relationship
     maintenance_team = db.relationship('MaintenanceTeam', backref='equipment_list')
+    technician = db.relationship('Technician', backref='default_equipment')
+    
+    def set_technician(self, technician):
+        """Set the default technician, keeping the denormalized name in step"""
+        self.technician = technician
+        self.default_technician = technician.name if technician else None
     
     def __repr__(self):
         return f'<Equipment {self.name}>'
@@ -67,6 +138,12 @@ class WorkCenter(db.Model):
     description = db.Column(db.Text)
     status = db.Column(db.String(20), default='Active')  # Active / Inactive
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Serves the name-ordered picker lookups
+    __table_args__ = (
+        db.Index('ix_workcenters_name', 'name'),
+    )
     
     def __repr__(self):
         return f'<WorkCenter {self.name}>'
@@ -81,16 +158,213 @@ class MaintenanceRequest(db.Model):
     workcenter_id = db.Column(db.Integer, db.ForeignKey('workcenters.id'))  # Nullable to allow equipment requests
     category = db.Column(db.String(50))
     maintenance_team_id = db.Column(db.Integer, db.ForeignKey('maintenance_teams.id'))
-    assigned_technician = db.Column(db.String(100))
+    assigned_technician_id = db.Column(db.Integer, db.ForeignKey('technicians.id'))
+    assigned_technician = db.Column(db.String(100))  # Name of assigned_technician_id, kept for display and exports
     scheduled_date = db.Column(db.DateTime)
     duration_hours = db.Column(db.Float)
     stage = db.Column(db.String(20), default='New')  # New / In Progress / Repaired / Scrap
+    recurrence_rule_id = db.Column(db.Integer, db.ForeignKey('recurrence_rules.id'))  # Set on generated preventive requests
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)  # When the request entered a closed stage, None while open
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Offline sync (sync.py); both are set by database triggers on every insert and update
+    change_seq = db.Column(db.Integer)  # Position in the global order of request changes
+    row_version = db.Column(db.Integer, nullable=False, server_default='1')  # Bumped by every update, for conflict checks
+    
+    # Composite indexes matching the board, calendar and equipment/team filters
+    __table_args__ = (
+        db.Index('ix_maintenance_requests_stage_scheduled', 'stage', 'scheduled_date'),
+        db.Index('ix_maintenance_requests_equipment_stage', 'equipment_id', 'stage'),
+        db.Index('ix_maintenance_requests_workcenter_stage', 'workcenter_id', 'stage'),
+        db.Index('ix_maintenance_requests_team_stage', 'maintenance_team_id', 'stage'),
+        # (filter, id) pairs let the paginated request list walk an index in id order
+        db.Index('ix_maintenance_requests_stage_id', 'stage', 'id'),
+        db.Index('ix_maintenance_requests_category_id', 'category', 'id'),
+        db.Index('ix_maintenance_requests_scheduled', 'scheduled_date'),
+        # One generated request per rule occurrence
+        db.Index('ix_maintenance_requests_rule_scheduled', 'recurrence_rule_id', 'scheduled_date', unique=True),
+        # Per-technician work queues and the assignment planner's booked slots
+        db.Index('ix_maintenance_requests_technician_stage', 'assigned_technician_id', 'stage', 'scheduled_date'),
+        # Daily rollups recompute one day of openings and completions at a time
+        db.Index('ix_maintenance_requests_created', 'created_at'),
+        db.Index('ix_maintenance_requests_completed', 'completed_at'),
+        # Devices pull the rows changed after their last sync cursor
+        db.Index('ix_maintenance_requests_change_seq', 'change_seq'),
+    )
     
     # Relationships
     equipment = db.relationship('Equipment', backref='maintenance_requests')
     workcenter = db.relationship('WorkCenter', backref='maintenance_requests')
     maintenance_team = db.relationship('MaintenanceTeam', backref='maintenance_requests')
+    recurrence_rule = db.relationship('RecurrenceRule', backref='generated_requests')
+    technician = db.relationship('Technician', backref='assigned_requests')
+    
+    def set_technician(self, technician):
+        """Assign a technician, keeping the denormalized name in step"""
+        self.technician = technician
+        self.assigned_technician = technician.name if technician else None
     
     def __repr__(self):
-        return f'<MaintenanceRequest {self.subject}>'
\ No newline at end of file
+        return f'<MaintenanceRequest {self.subject}>'
+
+@event.listens_for(MaintenanceRequest.stage, 'set')
+def _stamp_completed_at(target, value, oldvalue, initiator):
+    """Closing a request records when; reopening it clears that"""
+    if value in CLOSED_STAGES:
+        if oldvalue not in CLOSED_STAGES or target.completed_at is None:
+            target.completed_at = datetime.utcnow()
+    else:
+        target.completed_at = None
+
+# Recurrence units: calendar intervals and equipment operating hours
+RECURRENCE_UNITS = ['days', 'weeks', 'hours']
+
+class RecurrenceRule(db.Model):
+    __tablename__ = 'recurrence_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)  # Subject of the generated requests
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'))
+    workcenter_id = db.Column(db.Integer, db.ForeignKey('workcenters.id'))
+    maintenance_team_id = db.Column(db.Integer, db.ForeignKey('maintenance_teams.id'))
+    category = db.Column(db.String(50))
+    duration_hours = db.Column(db.Float)
+    interval = db.Column(db.Integer, nullable=False)
+    unit = db.Column(db.String(10), nullable=False)  # days / weeks / hours
+    next_due = db.Column(db.DateTime)  # Next calendar occurrence (days / weeks rules)
+    next_due_hours = db.Column(db.Float)  # Operating-hours reading that triggers the next request (hours rules)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # The scheduler only reads rules that are due inside its window
+    __table_args__ = (
+        db.Index('ix_recurrence_rules_active_next_due', 'active', 'next_due'),
+        db.Index('ix_recurrence_rules_active_unit', 'active', 'unit'),
+    )
+    
+    equipment = db.relationship('Equipment', backref='recurrence_rules')
+    workcenter = db.relationship('WorkCenter', backref='recurrence_rules')
+    maintenance_team = db.relationship('MaintenanceTeam', backref='recurrence_rules')
+    
+    def __repr__(self):
+        return f'<RecurrenceRule {self.name}>'
+
+class RequestRollup(db.Model):
+    """
+    Request totals for one day and one value of one report dimension (a team,
+    a category, ...; dimension 'all' holds the day's overall totals).
+    Maintained by analytics.refresh_rollups.
+    """
+    __tablename__ = 'request_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    month = db.Column(db.Date, nullable=False)  # First day of day's month, for grouping by month portably
+    dimension = db.Column(db.String(20), nullable=False)  # all / stage / team / category / equipment / workcenter / technician
+    dimension_value = db.Column(db.String(100))  # Stage or category name, or the team/equipment/... id
+    opened_count = db.Column(db.Integer, default=0, nullable=False)  # Requests created that day
+    completed_count = db.Column(db.Integer, default=0, nullable=False)  # Requests closed that day
+    repaired_count = db.Column(db.Integer, default=0, nullable=False)  # Of those, the ones repaired
+    repair_hours = db.Column(db.Float, default=0, nullable=False)  # Sum of their created -> completed time
+    scheduled_count = db.Column(db.Integer, default=0, nullable=False)  # Requests scheduled for that day
+    scheduled_hours = db.Column(db.Float, default=0, nullable=False)  # Sum of their durations
+    
+    __table_args__ = (
+        db.Index('ix_request_rollups_dimension_day', 'dimension', 'day'),
+        db.Index('ix_request_rollups_day', 'day'),
+        db.Index('ix_request_rollups_month', 'month'),
+    )
+
+class MonthlyRequestRollup(db.Model):
+    """request_rollups summed per calendar month, so long ranges read a row per month instead of per day"""
+    __tablename__ = 'request_monthly_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)
+    dimension_value = db.Column(db.String(100))
+    opened_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    repaired_count = db.Column(db.Integer, default=0, nullable=False)
+    repair_hours = db.Column(db.Float, default=0, nullable=False)
+    scheduled_count = db.Column(db.Integer, default=0, nullable=False)
+    scheduled_hours = db.Column(db.Float, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_request_monthly_rollups_dimension_month', 'dimension', 'month'),
+    )
+
+class RollupRequestDays(db.Model):
+    """The days each request was last counted under, so a change can clear its old days"""
+    __tablename__ = 'rollup_request_days'
+    
+    request_id = db.Column(db.Integer, primary_key=True)  # No foreign key: outlives deleted requests
+    opened_day = db.Column(db.Date)
+    completed_day = db.Column(db.Date)
+    scheduled_day = db.Column(db.Date)
+    removed = db.Column(db.Boolean, default=False, nullable=False)  # Request deleted, days not yet recounted
+    
+    __table_args__ = (
+        db.Index('ix_rollup_request_days_removed', 'removed'),
+    )
+
+class RollupState(db.Model):
+    """Progress of the incremental rollup job"""
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime)  # Highest updated_at processed
+    refreshed_at = db.Column(db.DateTime)
+
+class SyncSequence(db.Model):
+    """The last change sequence number handed out for a synced table"""
+    __tablename__ = 'sync_sequences'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+class SyncTombstone(db.Model):
+    """A deleted request, kept so synced devices learn that it is gone"""
+    __tablename__ = 'sync_tombstones'
+    
+    request_id = db.Column(db.Integer, primary_key=True)  # No foreign key: the request no longer exists
+    change_seq = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime)
+
+class AuditEvent(db.Model):
+    """One create, update or delete of a request or a piece of equipment; rows are only appended (audit.py)"""
+    __tablename__ = 'audit_events'
+    
+    id = db.Column(db.Integer, primary_key=True)  # AUTOINCREMENT: never reused, so ids follow time
+    entity_type = db.Column(db.String(20), nullable=False)  # request / equipment
+    entity_id = db.Column(db.Integer, nullable=False)  # No foreign key: history outlives the row
+    action = db.Column(db.String(10), nullable=False)  # create / update / delete
+    changes = db.Column(db.JSON, nullable=False)  # {field: [old, new]}
+    user_id = db.Column(db.Integer)  # Who made the change, None for scripts and jobs
+    username = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        # A timeline is one range read: the entity's events in id (= time) order
+        db.Index('ix_audit_events_entity', 'entity_type', 'entity_id', 'id'),
+        db.Index('ix_audit_events_created', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+
+class ArchivedAuditEvent(db.Model):
+    """Audit events moved out of audit_events by age (flask archive-audit), same columns and ids"""
+    __tablename__ = 'audit_events_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changes = db.Column(db.JSON, nullable=False)
+    user_id = db.Column(db.Integer)
+    username = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_audit_events_archive_entity', 'entity_type', 'entity_id', 'id'),
+    )
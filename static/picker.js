@@ -0,0 +1,124 @@
+// Async pickers: a search box that fills a hidden id field from /lookup/<kind>.
+// Choosing an option dispatches "picker:select" on the .picker element with the
+// option (id, label, detail and the kind's extra fields) in event.detail, or null
+// when the picker is cleared.
+(function() {
+    const DEBOUNCE_MS = 150;
+
+    function initPicker(root) {
+        const hidden = root.querySelector('input[type=hidden]');
+        const input = root.querySelector('.picker-input');
+        const list = root.querySelector('.picker-options');
+        const results = new Map();  // query -> options, for this page view
+        let options = [];
+        let active = -1;
+        let timer = null;
+        let latest = 0;
+        let selectedLabel = input.value;
+
+        function close() {
+            list.hidden = true;
+            input.setAttribute('aria-expanded', 'false');
+            active = -1;
+        }
+
+        function show(found) {
+            options = found;
+            active = -1;
+            list.replaceChildren(...found.map((option, index) => {
+                const item = document.createElement('li');
+                item.setAttribute('role', 'option');
+                item.textContent = option.label;
+                if (option.detail) {
+                    const detail = document.createElement('span');
+                    detail.className = 'picker-detail';
+                    detail.textContent = option.detail;
+                    item.append(detail);
+                }
+                item.addEventListener('mousedown', function(event) {
+                    event.preventDefault();  // Keep focus so blur doesn't revert the text first
+                    choose(options[index]);
+                });
+                return item;
+            }));
+            list.hidden = found.length === 0;
+            input.setAttribute('aria-expanded', String(!list.hidden));
+        }
+
+        function highlight(index) {
+            if (!options.length) {
+                return;
+            }
+            active = (index + options.length) % options.length;
+            list.querySelectorAll('li').forEach((item, i) => item.classList.toggle('active', i === active));
+        }
+
+        function load(query) {
+            if (results.has(query)) {
+                show(results.get(query));
+                return;
+            }
+            const requestId = ++latest;
+            fetch(root.dataset.lookupUrl + '?q=' + encodeURIComponent(query))
+                .then(response => response.json())
+                .then(found => {
+                    results.set(query, found);
+                    if (requestId === latest && document.activeElement === input) {
+                        show(found);
+                    }
+                });
+        }
+
+        function choose(option) {
+            hidden.value = option ? option.id : '';
+            input.value = option ? option.label : '';
+            selectedLabel = input.value;
+            close();
+            root.dispatchEvent(new CustomEvent('picker:select', {detail: option}));
+        }
+
+        root.clear = function() {
+            hidden.value = '';
+            input.value = selectedLabel = '';
+        };
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            timer = setTimeout(function() { load(input.value.trim()); }, DEBOUNCE_MS);
+        });
+        input.addEventListener('focus', function() {
+            // With a choice already made, start from the full list rather than that one name
+            load(input.value === selectedLabel ? '' : input.value.trim());
+        });
+        input.addEventListener('keydown', function(event) {
+            if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+                event.preventDefault();
+                if (list.hidden) {
+                    load(input.value === selectedLabel ? '' : input.value.trim());
+                } else {
+                    highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+                }
+            } else if (event.key === 'Enter' && !list.hidden) {
+                event.preventDefault();  // Don't submit the form
+                if (active >= 0) {
+                    choose(options[active]);
+                }
+            } else if (event.key === 'Escape') {
+                close();
+            }
+        });
+        input.addEventListener('blur', function() {
+            clearTimeout(timer);
+            close();
+            if (!input.value.trim()) {
+                if (hidden.value) {
+                    choose(null);
+                }
+            } else if (input.value !== selectedLabel) {
+                input.value = selectedLabel;  // Typed text that wasn't chosen doesn't change the value
+            }
+        });
+    }
+
+    document.querySelectorAll('.picker').forEach(initPicker);
+})();
@@ -0,0 +1,206 @@
+"""
+Delta sync of maintenance requests for offline devices (/api/v1/sync/requests).
+
+Every insert and update of a request stamps it with the next number of a
+single change sequence (change_seq) and bumps its row_version; deleting
+one writes a tombstone with the next number. Database triggers do the
+stamping, so bulk updates, imports and the scheduler are covered as well
+as ORM writes. SQLite runs one write transaction at a time, so sequence
+numbers become visible in order: a device that has seen everything up to
+cursor N only ever needs the rows and tombstones after N.
+
+Devices queue their edits while offline and send them as one batch. Each
+edit carries the row_version the device last saw and is applied only if
+the request is still at that version (or already has the edited values);
+otherwise it is reported as a conflict together with the current row.
+Edits to the same request within a batch are all checked against the
+version the request had when the batch started, so a device can queue
+Start and then Complete for one request.
+
+The triggers are SQLite-only, like the search index; on other databases
+sync_supported() is False and the endpoints answer 501.
+"""
+import math
+from dataclasses import dataclass, field
+from sqlalchemy import select
+from models import db, MaintenanceRequest, Equipment, SyncSequence, SyncTombstone, REQUEST_STAGES
+from counters import refresh_equipment_counters
+
+SEQUENCE = 'maintenance_requests'
+MAX_MUTATIONS = 500
+
+# Called with the ids of the requests a batch changed, after it commits (app.py feeds the live board)
+change_listeners = []
+
+
+def install_sync_triggers(conn):
+    """Number every request change and record deletions; existing rows are numbered by id"""
+    conn.exec_driver_sql(
+        "UPDATE maintenance_requests SET change_seq = id WHERE change_seq IS NULL")
+    conn.exec_driver_sql(
+        f"INSERT OR IGNORE INTO sync_sequences (name, value) VALUES ('{SEQUENCE}', 0)")
+    conn.exec_driver_sql(
+        "UPDATE sync_sequences SET value = max(value, (SELECT coalesce(max(change_seq), 0) FROM maintenance_requests)) "
+        f"WHERE name = '{SEQUENCE}'")
+
+    next_seq = f"UPDATE sync_sequences SET value = value + 1 WHERE name = '{SEQUENCE}'"
+    current_seq = f"(SELECT value FROM sync_sequences WHERE name = '{SEQUENCE}')"
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS maintenance_requests_sync_insert AFTER INSERT ON maintenance_requests "
+        f"BEGIN {next_seq}; "
+        f"UPDATE maintenance_requests SET change_seq = {current_seq} WHERE id = new.id; END")
+    # The trigger's own UPDATE changes change_seq, which the WHEN clause skips
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS maintenance_requests_sync_update AFTER UPDATE ON maintenance_requests "
+        "WHEN new.change_seq IS old.change_seq "
+        f"BEGIN {next_seq}; "
+        f"UPDATE maintenance_requests SET change_seq = {current_seq}, row_version = old.row_version + 1 "
+        "WHERE id = new.id; END")
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS maintenance_requests_sync_delete AFTER DELETE ON maintenance_requests "
+        f"BEGIN {next_seq}; "
+        "INSERT OR REPLACE INTO sync_tombstones (request_id, change_seq, deleted_at) "
+        f"VALUES (old.id, {current_seq}, datetime('now')); END")
+
+
+def sync_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def current_cursor():
+    """The newest change number handed out"""
+    sequence = db.session.get(SyncSequence, SEQUENCE)
+    return sequence.value if sequence else 0
+
+
+@dataclass
+class ChangePage:
+    requests: list  # Changed requests, oldest change first
+    deleted: list  # Ids of deleted requests
+    cursor: int  # Pass back as ?cursor= to continue
+    has_more: bool
+
+
+def changes_since(cursor, limit):
+    """The first `limit` request changes and deletions numbered after `cursor`"""
+    rows = (MaintenanceRequest.query
+            .filter(MaintenanceRequest.change_seq > cursor)
+            .order_by(MaintenanceRequest.change_seq)
+            .limit(limit + 1).all())
+    tombstones = db.session.execute(
+        select(SyncTombstone.request_id, SyncTombstone.change_seq)
+        .where(SyncTombstone.change_seq > cursor)
+        .order_by(SyncTombstone.change_seq)
+        .limit(limit + 1)).all()
+
+    # Merge both streams in sequence order and cut the page at `limit` changes
+    changes = sorted([(row.change_seq, row) for row in rows] +
+                     [(tombstone.change_seq, tombstone.request_id) for tombstone in tombstones],
+                     key=lambda change: change[0])
+    page = changes[:limit]
+    return ChangePage(
+        requests=[change for _, change in page if isinstance(change, MaintenanceRequest)],
+        deleted=[change for _, change in page if not isinstance(change, MaintenanceRequest)],
+        cursor=page[-1][0] if page else cursor,
+        has_more=len(changes) > limit,
+    )
+
+
+def _stage(value):
+    if value not in REQUEST_STAGES:
+        raise ValueError(f'stage must be one of {", ".join(REQUEST_STAGES)}')
+    return value
+
+
+def _hours(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise ValueError('duration_hours must be a non-negative number')
+    return float(value)
+
+
+# Fields a device may edit -> validator returning the value to store
+MUTABLE_FIELDS = {
+    'stage': _stage,
+    'duration_hours': _hours,
+}
+
+
+@dataclass
+class MutationResult:
+    id: object
+    status: str  # applied / unchanged / conflict / not_found / invalid
+    error: str = None
+    request: MaintenanceRequest = field(default=None, repr=False)  # The row as it now is
+
+
+def _validated_changes(mutation):
+    changes = mutation.get('changes')
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('changes must be a non-empty object')
+    unknown = sorted(changes.keys() - MUTABLE_FIELDS.keys())
+    if unknown:
+        raise ValueError(f'Fields cannot be changed: {", ".join(unknown)}')
+    return {name: MUTABLE_FIELDS[name](value) for name, value in changes.items()}
+
+
+def apply_mutations(mutations):
+    """
+    Apply a batch of queued edits, each {"id", "row_version", "changes":
+    {field: value}}, in one transaction. Returns a MutationResult per edit,
+    in order.
+    """
+    ids = {mutation.get('id') for mutation in mutations if isinstance(mutation.get('id'), int)}
+    rows = {row.id: row for row in
+            MaintenanceRequest.query.filter(MaintenanceRequest.id.in_(ids)).with_for_update()} if ids else {}
+    # row_version is bumped by the trigger in the database, so these stay at the batch's starting versions
+    base_versions = {row_id: row.row_version for row_id, row in rows.items()}
+
+    results = []
+    changed = set()
+    equipment_ids = set()
+    for mutation in mutations:
+        request_id = mutation.get('id')
+        try:
+            if not isinstance(request_id, int) or not isinstance(mutation.get('row_version'), int):
+                raise ValueError('id and row_version must be integers')
+            changes = _validated_changes(mutation)
+        except ValueError as error:
+            results.append(MutationResult(request_id, 'invalid', str(error)))
+            continue
+
+        row = rows.get(request_id)
+        if row is None:
+            results.append(MutationResult(request_id, 'not_found'))
+            continue
+        if all(getattr(row, name) == value for name, value in changes.items()):
+            # Already applied, e.g. a batch resent after its response was lost
+            results.append(MutationResult(request_id, 'unchanged', request=row))
+            continue
+        if mutation['row_version'] != base_versions[request_id]:
+            results.append(MutationResult(request_id, 'conflict', request=row))
+            continue
+
+        for name, value in changes.items():
+            setattr(row, name, value)
+        if changes.get('stage') == 'Scrap' and row.equipment_id:
+            # The equipment may have been deleted; the foreign key isn't enforced on SQLite
+            equipment = db.session.get(Equipment, row.equipment_id)
+            if equipment:
+                equipment.status = 'Scrapped'
+                equipment.notes = f"Marked as scrapped due to maintenance request: {row.subject}"
+        changed.add(request_id)
+        equipment_ids.add(row.equipment_id)
+        results.append(MutationResult(request_id, 'applied', request=row))
+
+    if changed:
+        refresh_equipment_counters(equipment_ids)
+    db.session.commit()
+    if rows:
+        # Reload the committed rows (with their new versions) in one query
+        MaintenanceRequest.query.filter(MaintenanceRequest.id.in_(list(rows))).all()
+    if changed:
+        for listener in change_listeners:
+            listener(sorted(changed))
+    return results
@@ -0,0 +1,98 @@
+"""
+Technicians and team membership.
+
+Technicians used to be free-text names: comma-separated in
+MaintenanceTeam.members and copied into Equipment.default_technician and
+MaintenanceRequest.assigned_technician. They are now Technician rows linked
+to teams through team_memberships, and equipment and requests reference
+them by id (default_technician_id / assigned_technician_id). The name
+columns are kept as denormalized copies for display, exports and the API,
+and are written together with the id through set_technician().
+
+Names typed into forms or imported from files are resolved with
+get_or_create_technicians(), which creates unknown names as new
+technicians. link_technicians() does the same set-based, for rows written
+before the ids existed: the migration, the seed scripts and bulk loads.
+"""
+from sqlalchemy import select, insert, func
+from models import db, Technician, MaintenanceTeam, Equipment, MaintenanceRequest, team_memberships
+
+
+def parse_names(text):
+    """Split a comma-separated list of names, dropping blanks and duplicates"""
+    names = []
+    for name in (text or '').split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _technician_ids(conn, names):
+    """{name: id} for `names`, inserting the ones that don't exist yet"""
+    names = {name.strip() for name in names if name and name.strip()}
+    if not names:
+        return {}
+    ids = dict(conn.execute(select(Technician.name, Technician.id).where(Technician.name.in_(names))).all())
+    missing = names - ids.keys()
+    if missing:
+        conn.execute(insert(Technician), [{'name': name} for name in sorted(missing)])
+        ids.update(conn.execute(select(Technician.name, Technician.id).where(Technician.name.in_(missing))).all())
+    return ids
+
+
+def technician_ids(names):
+    """{name: id} for `names` within the current session, creating unknown technicians"""
+    db.session.flush()
+    return _technician_ids(db.session, names)
+
+
+def find_or_create_technician(name):
+    """The Technician called `name` (created if new), or None for a blank name"""
+    name = (name or '').strip()
+    if not name:
+        return None
+    return db.session.get(Technician, technician_ids([name])[name])
+
+
+def set_team_members(team, text):
+    """Replace a team's technicians with the comma-separated names in `text`"""
+    names = parse_names(text)
+    ids = technician_ids(names)
+    team.technicians = [db.session.get(Technician, ids[name]) for name in names]
+    team.members = ', '.join(names)
+
+
+def link_technicians(conn):
+    """
+    Create technicians for every name that is only stored as text and point
+    the id columns at them. Teams with no memberships get them from their
+    members text. Idempotent: rows that already have an id are left alone.
+    """
+    teams = conn.execute(
+        select(MaintenanceTeam.id, MaintenanceTeam.members)
+        .where(~select(team_memberships.c.team_id)
+               .where(team_memberships.c.team_id == MaintenanceTeam.id).exists())).all()
+    team_names = {team.id: parse_names(team.members) for team in teams}
+
+    names = {name for members in team_names.values() for name in members}
+    names.update(conn.scalars(select(func.trim(Equipment.default_technician)).distinct()
+                              .where(Equipment.default_technician_id.is_(None))))
+    names.update(conn.scalars(select(func.trim(MaintenanceRequest.assigned_technician)).distinct()
+                              .where(MaintenanceRequest.assigned_technician_id.is_(None))))
+    ids = _technician_ids(conn, names)
+
+    memberships = [{'team_id': team_id, 'technician_id': ids[name]}
+                   for team_id, members in team_names.items() for name in members]
+    if memberships:
+        conn.execute(insert(team_memberships), memberships)
+
+    for model, id_column, name_column in (
+            (Equipment, Equipment.default_technician_id, Equipment.default_technician),
+            (MaintenanceRequest, MaintenanceRequest.assigned_technician_id, MaintenanceRequest.assigned_technician)):
+        technician_id = (select(Technician.id)
+                         .where(Technician.name == func.trim(name_column))
+                         .scalar_subquery())
+        conn.execute(model.__table__.update()
+                     .where(id_column.is_(None), name_column.isnot(None))
+                     .values({id_column.key: technician_id}))
@@ -0,0 +1,114 @@
+"""
+In-memory login attempt limiter.
+
+Password hashes are deliberately slow, so a burst of login attempts is a
+burst of CPU. Every attempt is counted against its account (the email
+address) and its client IP before any hash is computed, and an attempt
+over either limit is rejected straight away. A successful login clears
+its account's count and takes its own attempt back off the IP's, so a
+shift logging in from one shared address doesn't lock itself out. Token
+sign-ins don't name an account until the token is verified, so they are
+only counted against their IP.
+
+  LOGIN_ACCOUNT_ATTEMPTS  attempts per account per window (default 5)
+  LOGIN_IP_ATTEMPTS       attempts per client IP per window (default 30)
+  LOGIN_THROTTLE_WINDOW   window length in seconds (default 300)
+
+The counts live in the memory of one worker process, like the event
+broker, and are bounded to the most recently seen keys.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+LOGIN_ACCOUNT_ATTEMPTS = int(os.getenv('LOGIN_ACCOUNT_ATTEMPTS', '5'))
+LOGIN_IP_ATTEMPTS = int(os.getenv('LOGIN_IP_ATTEMPTS', '30'))
+LOGIN_THROTTLE_WINDOW = float(os.getenv('LOGIN_THROTTLE_WINDOW', '300'))
+MAX_TRACKED_KEYS = 10000
+
+
+class AttemptLimiter:
+    """Thread-safe sliding-window counter of attempts per key"""
+
+    def __init__(self, limit, window, maxsize=MAX_TRACKED_KEYS):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._attempts = OrderedDict()  # key -> deque of attempt times, oldest first
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        return attempts
+
+    def retry_after(self, key, now=None):
+        """Seconds until `key` may attempt again, 0 if it may now"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            attempts = self._recent(key, now)
+            if not attempts or len(attempts) < self.limit:
+                return 0
+            return attempts[-self.limit] + self.window - now
+
+    def add(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            attempts = self._recent(key, now)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+            while len(self._attempts) > self.maxsize:
+                self._attempts.popitem(last=False)
+
+    def forgive(self, key):
+        """Take back the most recent attempt"""
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts:
+                attempts.pop()
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+
+class LoginThrottle:
+    def __init__(self, account_limit=LOGIN_ACCOUNT_ATTEMPTS, ip_limit=LOGIN_IP_ATTEMPTS,
+                 window=LOGIN_THROTTLE_WINDOW):
+        self.accounts = AttemptLimiter(account_limit, window)
+        self.ips = AttemptLimiter(ip_limit, window)
+        # Check and record as one step, so a concurrent burst can't all pass the check first
+        self._lock = threading.Lock()
+
+    def attempt(self, account, ip):
+        """
+        Count a login attempt (account None: against the IP only). Returns 0
+        if it may go ahead, otherwise the seconds to wait (the rejected
+        attempt itself is not counted).
+        """
+        account = account.strip().lower() if account is not None else None
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.accounts.retry_after(account, now) if account is not None else 0,
+                       self.ips.retry_after(ip, now))
+            if wait:
+                return wait
+            if account is not None:
+                self.accounts.add(account, now)
+            self.ips.add(ip, now)
+            return 0
+
+    def succeeded(self, account, ip):
+        with self._lock:
+            if account is not None:
+                self.accounts.reset(account.strip().lower())
+            self.ips.forgive(ip)
+
+
+login_throttle = LoginThrottle()